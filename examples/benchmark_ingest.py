@@ -0,0 +1,69 @@
+from os import path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from mbta_gtfs_sqlite import MbtaGtfsArchive
+from mbta_gtfs_sqlite.build import (
+    GtfsFeedDownloadResult,
+    download_feed_zip,
+)
+from mbta_gtfs_sqlite.ingest import (
+    SHAPES_TRANSFORMS,
+    STOP_TIMES_TRANSFORMS,
+    ingest_feed_info,
+    ingest_rows,
+)
+from mbta_gtfs_sqlite.models import ShapePoint, StopTime
+from mbta_gtfs_sqlite.reader import GtfsReader, ZipGtfsReader
+from mbta_gtfs_sqlite.session import create_sqlalchemy_session
+
+from .config import LOCAL_ARCHIVE_PATH
+
+INGEST_ENGINES = ("sqlalchemy", "executemany")
+BATCH_SIZE = 300000
+
+
+def time_ingest(
+    work_dir: str,
+    reader: GtfsReader,
+    download: GtfsFeedDownloadResult,
+    ingest_engine: str,
+):
+    session = create_sqlalchemy_session(path.join(work_dir, f"{ingest_engine}.db"))
+    feed_info = ingest_feed_info(session, download, reader)
+    timings = {}
+    for model, read_rows, transforms in (
+        (StopTime, reader.read_stop_times, STOP_TIMES_TRANSFORMS),
+        (ShapePoint, reader.read_shapes, SHAPES_TRANSFORMS),
+    ):
+        start = perf_counter()
+        ingest_rows(
+            session=session,
+            model=model,
+            feed_info=feed_info,
+            rows=read_rows(),
+            batch_size=BATCH_SIZE,
+            transforms=transforms,
+            ingest_engine=ingest_engine,
+        )
+        session.commit()
+        timings[model.__name__] = perf_counter() - start
+    session.close()
+    return timings
+
+
+def benchmark_latest_feed():
+    archive = MbtaGtfsArchive(local_archive_path=LOCAL_ARCHIVE_PATH)
+    latest_feed = archive.get_latest_feed()
+    with TemporaryDirectory() as work_dir:
+        zip_path = path.join(work_dir, "data.zip")
+        download = download_feed_zip(latest_feed.url, zip_path)
+        reader = ZipGtfsReader(zip_path)
+        for ingest_engine in INGEST_ENGINES:
+            timings = time_ingest(work_dir, reader, download, ingest_engine)
+            for table, seconds in timings.items():
+                print(f"{ingest_engine:>12} {table:>12}: {seconds:.2f}s")
+
+
+if __name__ == "__main__":
+    benchmark_latest_feed()
@@ -0,0 +1,95 @@
+import random
+from time import perf_counter
+from typing import Callable, List, Tuple
+
+from sqlalchemy.orm import Session
+
+from mbta_gtfs_sqlite import MbtaGtfsArchive
+from mbta_gtfs_sqlite.models import Shape, Stop
+from mbta_gtfs_sqlite.spatial import (
+    get_distance,
+    get_nearest_stops,
+    snap_to_segment,
+    snap_to_shape,
+)
+from mbta_gtfs_sqlite.utils.polyline import decode_polyline
+
+from .config import LOCAL_ARCHIVE_PATH
+
+QUERY_COUNT = 200
+NEAREST_STOP_COUNT = 5
+
+
+def get_nearest_stops_by_scan(session: Session, lat: float, lon: float):
+    # Loads every stop and sorts them all by distance
+    stops = session.query(Stop).filter(Stop.stop_lat.isnot(None)).all()
+    return sorted(
+        (
+            (stop, get_distance(lat, lon, stop.stop_lat, stop.stop_lon))
+            for stop in stops
+        ),
+        key=lambda stop_with_distance: stop_with_distance[1],
+    )[:NEAREST_STOP_COUNT]
+
+
+def snap_to_shape_by_scan(session: Session, lat: float, lon: float):
+    # Decodes every shape and measures the distance to every segment
+    nearest_distance = None
+    for (polyline,) in session.query(Shape.polyline):
+        points = decode_polyline(polyline)
+        for start, end in zip(points, points[1:]):
+            _, _, distance = snap_to_segment(lat, lon, (*start, *end))
+            if nearest_distance is None or distance < nearest_distance:
+                nearest_distance = distance
+    return nearest_distance
+
+
+def time_queries(
+    label: str,
+    query: Callable[[float, float], object],
+    points: List[Tuple[float, float]],
+):
+    start = perf_counter()
+    for lat, lon in points:
+        query(lat, lon)
+    elapsed = perf_counter() - start
+    print(f"{label}: {1000 * elapsed / len(points):.3f}ms per query")
+
+
+def benchmark_latest_feed():
+    archive = MbtaGtfsArchive(local_archive_path=LOCAL_ARCHIVE_PATH)
+    feed = archive.get_latest_feed()
+    feed.download_or_build()
+    session = feed.create_sqlite_session(compact=True, read_only=True)
+    # Random points across the stops' bounding box
+    stops = session.query(Stop).filter(Stop.stop_lat.isnot(None)).all()
+    lats = [stop.stop_lat for stop in stops]
+    lons = [stop.stop_lon for stop in stops]
+    points = [
+        (random.uniform(min(lats), max(lats)), random.uniform(min(lons), max(lons)))
+        for _ in range(QUERY_COUNT)
+    ]
+    time_queries(
+        "nearest stops (scan)",
+        lambda lat, lon: get_nearest_stops_by_scan(session, lat, lon),
+        points,
+    )
+    time_queries(
+        "nearest stops (r*tree)",
+        lambda lat, lon: get_nearest_stops(session, lat, lon, NEAREST_STOP_COUNT),
+        points,
+    )
+    time_queries(
+        "snap to shape (scan)",
+        lambda lat, lon: snap_to_shape_by_scan(session, lat, lon),
+        points[:10],
+    )
+    time_queries(
+        "snap to shape (r*tree)",
+        lambda lat, lon: snap_to_shape(session, lat, lon),
+        points,
+    )
+
+
+if __name__ == "__main__":
+    benchmark_latest_feed()
@@ -1,12 +1,15 @@
-from typing import List
+from typing import Union
+
+import numpy as np
 from sqlalchemy.orm import Session
 from mbta_gtfs_sqlite import MbtaGtfsArchive
 from mbta_gtfs_sqlite.models import (
     RoutePattern,
     RoutePatternTypicality,
     Trip,
-    ShapePoint,
+    Shape,
 )
+from mbta_gtfs_sqlite.utils.polyline import decode_polyline_to_array
 
 from .config import LOCAL_ARCHIVE_PATH
 
@@ -14,26 +17,21 @@ from .config import LOCAL_ARCHIVE_PATH
 def get_shape_for_route(
     session: Session,
     route_id: str,
-) -> List[ShapePoint]:
-    route_pattern = (
-        session.query(RoutePattern)
+) -> Union[None, np.ndarray]:
+    shape = (
+        session.query(Shape)
+        .join(Trip, Trip.shape_id == Shape.shape_id)
+        .join(RoutePattern, RoutePattern.representative_trip_id == Trip.trip_id)
         .filter(
             RoutePattern.route_id == route_id,
             RoutePattern.route_pattern_typicality == RoutePatternTypicality.TYPICAL,
         )
         .first()
     )
-    representative_trip = (
-        session.query(Trip)
-        .filter(Trip.trip_id == route_pattern.representative_trip_id)
-        .first()
-    )
-    shape_points = (
-        session.query(ShapePoint)
-        .filter(ShapePoint.shape_id == representative_trip.shape_id)
-        .order_by(ShapePoint.shape_pt_sequence)
-    ).all()
-    return shape_points
+    if shape is None:
+        return None
+    # Every point of the shape comes back in a single row
+    return decode_polyline_to_array(shape.polyline)
 
 
 def get_session_for_latest_feed() -> Session:
@@ -45,6 +43,10 @@ def get_session_for_latest_feed() -> Session:
 
 if __name__ == "__main__":
     session = get_session_for_latest_feed()
-    shape_points = get_shape_for_route(session, "Red")
-    for point in shape_points:
-        print((point.shape_pt_lat, point.shape_pt_lon))
+    route_id = "Red"
+    shape_points = get_shape_for_route(session, route_id)
+    if shape_points is None:
+        print(f"No typical shape for route {route_id}")
+    else:
+        for lat, lon in shape_points:
+            print((lat, lon))
@@ -1,29 +1,37 @@
 from csv import DictReader
-from datetime import date
-from typing import Dict, Union, List
-
-import requests
+from datetime import date, timedelta
+from functools import cached_property
+from typing import TYPE_CHECKING, Dict, Iterable, Union, List
 
 from .utils.time import date_from_string
 from .utils.indexes import index_by
-from .feed import GtfsFeed
+from .utils.intervals import DateIntervalIndex
+from .archive_index import DEFAULT_INDEX_TTL, load_archive_index
+from .feed import GtfsFeed, DEFAULT_INGEST_BATCH_SIZE
+from .sync import FeedSyncProgressCallback, FeedSyncResult, sync_feeds
+from .transfer import DEFAULT_TRANSFER_WORKERS
+
+if TYPE_CHECKING:
+    from .consolidate import ConsolidatedDb
+    from .ingest import IngestEngine
 
 MBTA_GTFS_ARCHIVE_URL = "https://cdn.mbta.com/archive/archived_feeds.txt"
 
 
 class MbtaGtfsArchive(object):
-    _feeds: Dict[str, GtfsFeed]
-
     def __init__(
         self,
         local_archive_path: str,
         s3_bucket=None,
         archive_url=MBTA_GTFS_ARCHIVE_URL,
+        index_ttl: timedelta = DEFAULT_INDEX_TTL,
+        offline: bool = False,
     ):
         self.local_archive_path = local_archive_path
         self._s3_bucket = s3_bucket
         self.archive_url = archive_url
-        self._load_feeds()
+        self.index_ttl = index_ttl
+        self.offline = offline
 
     @property
     def s3_bucket(self):
@@ -31,9 +39,17 @@ class MbtaGtfsArchive(object):
             raise RuntimeError("No S3 bucket configured for archive")
         return self._s3_bucket
 
-    def _load_feeds(self):
-        req = requests.get(self.archive_url)
-        lines = req.text.splitlines()
+    @cached_property
+    def _feeds(self) -> Dict[str, GtfsFeed]:
+        # The index of feeds is loaded on first use, and is cached in the local
+        # archive so that it only needs to be revalidated once index_ttl passes
+        index_text = load_archive_index(
+            self.archive_url,
+            self.local_archive_path,
+            ttl=self.index_ttl,
+            offline=self.offline,
+        )
+        lines = index_text.splitlines()
         reader = DictReader(lines, delimiter=",")
         feeds = []
         for entry in reader:
@@ -51,7 +67,19 @@ class MbtaGtfsArchive(object):
                 url=url,
             )
             feeds.append(gtfs_feed)
-        self._feeds = index_by(feeds, lambda f: f.key)
+        return index_by(feeds, lambda f: f.key)
+
+    @cached_property
+    def _feeds_by_date(self) -> DateIntervalIndex[GtfsFeed]:
+        return DateIntervalIndex(
+            self._feeds.values(),
+            get_start_date=lambda feed: feed.start_date,
+            get_end_date=lambda feed: feed.end_date,
+        )
+
+    def reload_feeds(self):
+        self.__dict__.pop("_feeds", None)
+        self.__dict__.pop("_feeds_by_date", None)
 
     def get_feed_by_key(self, key: str):
         return self._feeds.get(key)
@@ -61,20 +89,85 @@ class MbtaGtfsArchive(object):
         start_date: Union[None, date] = None,
         end_date: Union[None, date] = None,
     ) -> List[GtfsFeed]:
-        matching_feeds = []
-        for feed in self._feeds.values():
-            if feed.matches_date_range(start_date=start_date, end_date=end_date):
-                matching_feeds.append(feed)
-        return list(sorted(matching_feeds, key=lambda feed: feed.start_date))
+        return self._feeds_by_date.overlapping(start_date=start_date, end_date=end_date)
 
     def get_all_feeds(self):
         return self.get_feeds_for_dates()
 
     def get_feed_for_date(self, target_date: date):
-        for feed in self._feeds.values():
-            if target_date >= feed.start_date and target_date <= feed.end_date:
-                return feed
-        return None
+        # Where feeds overlap, the one that starts latest (the newest) wins
+        return self._feeds_by_date.at(target_date)
+
+    def get_feed_for_each_date(
+        self,
+        target_dates: Iterable[date],
+    ) -> Dict[date, Union[None, GtfsFeed]]:
+        return self._feeds_by_date.at_many(target_dates)
 
     def get_latest_feed(self):
         return self.get_feeds_for_dates()[-1]
+
+    def build_all(
+        self,
+        feeds: Union[None, List[GtfsFeed]] = None,
+        download_workers: int = 4,
+        build_workers: Union[None, int] = None,
+        on_progress: Union[None, FeedSyncProgressCallback] = None,
+        ingest_batch_size: Union[None, int] = DEFAULT_INGEST_BATCH_SIZE,
+        ingest_engine: "IngestEngine" = "sqlalchemy",
+        bulk_build: bool = False,
+        rebuild_db: bool = True,
+        rebuild_compact_db: bool = True,
+        force_download: bool = False,
+    ) -> List[FeedSyncResult]:
+        if feeds is None:
+            feeds = self.get_all_feeds()
+        return sync_feeds(
+            feeds,
+            download_workers=download_workers,
+            build_workers=build_workers,
+            on_progress=on_progress,
+            ingest_batch_size=ingest_batch_size,
+            ingest_engine=ingest_engine,
+            bulk_build=bulk_build,
+            rebuild_db=rebuild_db,
+            rebuild_compact_db=rebuild_compact_db,
+            force_download=force_download,
+        )
+
+    def download_from_s3(
+        self,
+        feeds: List[GtfsFeed],
+        max_workers: int = DEFAULT_TRANSFER_WORKERS,
+    ):
+        from .transfer import download_feeds
+
+        download_feeds(feeds, max_workers=max_workers)
+
+    def upload_to_s3(
+        self,
+        feeds: List[GtfsFeed],
+        max_workers: int = DEFAULT_TRANSFER_WORKERS,
+    ):
+        from .transfer import upload_feeds
+
+        upload_feeds(feeds, max_workers=max_workers)
+
+    def build_consolidated_db(
+        self,
+        db_path: str,
+        feeds: Union[None, List[GtfsFeed]] = None,
+    ) -> "ConsolidatedDb":
+        from .consolidate import ConsolidatedDb
+
+        # Feeds that are already in the consolidated db are skipped, so this can
+        # be run again to append the newest feeds
+        consolidated_db = ConsolidatedDb(db_path)
+        if feeds is None:
+            feeds = self.get_all_feeds()
+        existing_keys = set(consolidated_db.get_feed_keys())
+        for feed in sorted(feeds, key=lambda feed: feed.start_date):
+            if feed.key not in existing_keys:
+                feed.download_or_build()
+                consolidated_db.append_gtfs_feed(feed)
+        return consolidated_db
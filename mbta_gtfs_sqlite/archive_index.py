@@ -0,0 +1,104 @@
+import json
+from dataclasses import asdict, dataclass
+from datetime import timedelta
+from os import path, makedirs
+from time import time
+from typing import Union
+
+import requests
+
+from .utils.files import atomic_write_path
+
+INDEX_FILE = "archived_feeds.txt"
+INDEX_METADATA_FILE = "archived_feeds.json"
+DEFAULT_INDEX_TTL = timedelta(hours=1)
+INDEX_REQUEST_TIMEOUT = 30
+
+
+@dataclass
+class ArchiveIndexMetadata(object):
+    url: str
+    fetched_at: float
+    etag: Union[None, str] = None
+    last_modified: Union[None, str] = None
+
+
+def write_file_atomically(file_path: str, text: str):
+    with atomic_write_path(file_path) as temp_path:
+        with open(temp_path, "w") as file:
+            file.write(text)
+
+
+def read_cached_index(cache_dir: str, url: str):
+    index_path = path.join(cache_dir, INDEX_FILE)
+    metadata_path = path.join(cache_dir, INDEX_METADATA_FILE)
+    try:
+        with open(metadata_path, "r") as file:
+            metadata = ArchiveIndexMetadata(**json.load(file))
+        with open(index_path, "r") as file:
+            text = file.read()
+    except (FileNotFoundError, TypeError, ValueError):
+        return None, None
+    if metadata.url != url:
+        return None, None
+    return text, metadata
+
+
+def write_cached_index(
+    cache_dir: str,
+    text: Union[None, str],
+    metadata: ArchiveIndexMetadata,
+):
+    makedirs(cache_dir, exist_ok=True)
+    if text is not None:
+        write_file_atomically(path.join(cache_dir, INDEX_FILE), text)
+    write_file_atomically(
+        path.join(cache_dir, INDEX_METADATA_FILE),
+        json.dumps(asdict(metadata)),
+    )
+
+
+def load_archive_index(
+    url: str,
+    cache_dir: str,
+    ttl: timedelta = DEFAULT_INDEX_TTL,
+    offline: bool = False,
+) -> str:
+    cached_text, metadata = read_cached_index(cache_dir, url)
+    if cached_text is not None:
+        age = time() - metadata.fetched_at
+        if offline or age < ttl.total_seconds():
+            return cached_text
+    elif offline:
+        raise RuntimeError(f"No cached copy of {url} is available offline")
+    headers = {}
+    if cached_text is not None:
+        if metadata.etag:
+            headers["If-None-Match"] = metadata.etag
+        if metadata.last_modified:
+            headers["If-Modified-Since"] = metadata.last_modified
+    try:
+        response = requests.get(url, headers=headers, timeout=INDEX_REQUEST_TIMEOUT)
+        if response.status_code == 304 and cached_text is not None:
+            metadata.fetched_at = time()
+            write_cached_index(cache_dir, None, metadata)
+            return cached_text
+        response.raise_for_status()
+    except requests.RequestException:
+        # Fall back to a stale copy rather than failing when the index can't be
+        # reached
+        if cached_text is not None:
+            return cached_text
+        raise
+    text = response.text
+    write_cached_index(
+        cache_dir,
+        text,
+        ArchiveIndexMetadata(
+            url=url,
+            fetched_at=time(),
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        ),
+    )
+    return text
@@ -1,15 +1,17 @@
 from dataclasses import dataclass
-from os import path, remove, listdir
-from shutil import copy, rmtree
-from zipfile import ZipFile
+from os import path, remove, replace
 from hashlib import md5
-from typing import Union
+from typing import TYPE_CHECKING, Union
 
 
 import requests
 
-from .reader import GtfsReader
-from .feed import GtfsFeed
+from .reader import create_gtfs_reader
+from .feed import COLUMNAR_FILES, GtfsFeed
+
+if TYPE_CHECKING:
+    from .compact import CompactionProfile
+    from .ingest import IngestEngine
 
 
 @dataclass
@@ -18,93 +20,249 @@ class GtfsFeedDownloadResult(object):
     zip_md5_checksum: str
 
 
-def download_feed_zip(feed_url: str, target_path: str):
-    response = requests.get(feed_url, stream=True)
-    block_size = 1024
-    with open(target_path, "wb") as file:
-        for data in response.iter_content(block_size):
-            file.write(data)
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
 
 
-def unzip_feed(zip_path: str, target_path: str):
-    zf = ZipFile(zip_path)
-    zf.extractall(target_path)
-    items = listdir(target_path)
-    if len(items) == 1:
-        inner_dir = items[0]
-        inner_dir_path = path.join(target_path, inner_dir)
-        for file in listdir(inner_dir_path):
-            copy(path.join(inner_dir_path, file), target_path)
-        rmtree(inner_dir_path)
+def update_hash_from_file(file_path: str, hasher) -> int:
+    size = 0
+    with open(file_path, "rb") as file:
+        while chunk := file.read(DOWNLOAD_CHUNK_SIZE):
+            hasher.update(chunk)
+            size += len(chunk)
+    return size
 
 
 def get_zip_checksum(zip_path: str) -> str:
-    with open(zip_path, "rb") as file:
-        chunk_size = 4096
-        hasher = md5()
-        while chunk := file.read(chunk_size):
-            hasher.update(chunk)
+    hasher = md5()
+    update_hash_from_file(zip_path, hasher)
     checksum = hasher.hexdigest()
     return checksum
 
 
+def get_known_zip_checksum(zip_path: str) -> Union[None, str]:
+    # A checksum file is only written once a download completes, so a zip that
+    # has one is known to be whole
+    checksum_path = f"{zip_path}.md5"
+    if not (path.exists(zip_path) and path.exists(checksum_path)):
+        return None
+    with open(checksum_path, "r") as file:
+        return file.read().strip() or None
+
+
+def get_resume_validator(response: requests.Response) -> Union[None, str]:
+    # If-Range only accepts a strong ETag or a Last-Modified date
+    etag = response.headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return response.headers.get("Last-Modified")
+
+
+def read_resume_validator(validator_path: str) -> Union[None, str]:
+    if not path.exists(validator_path):
+        return None
+    with open(validator_path, "r") as file:
+        return file.read().strip() or None
+
+
+def download_feed_zip(
+    feed_url: str,
+    target_path: str,
+    force: bool = False,
+) -> GtfsFeedDownloadResult:
+    known_checksum = None if force else get_known_zip_checksum(target_path)
+    if known_checksum:
+        return GtfsFeedDownloadResult(url=feed_url, zip_md5_checksum=known_checksum)
+    # Bytes are written to a partial file and hashed as they arrive. If an
+    # earlier download was interrupted, we pick up where it left off, as long
+    # as the server can tell us the file hasn't changed since.
+    partial_path = f"{target_path}.part"
+    validator_path = f"{partial_path}.validator"
+    validator = read_resume_validator(validator_path)
+    hasher = md5()
+    offset = 0
+    if path.exists(partial_path) and validator:
+        offset = update_hash_from_file(partial_path, hasher)
+    headers = {"Range": f"bytes={offset}-", "If-Range": validator} if offset else {}
+    response = requests.get(feed_url, stream=True, headers=headers)
+    if offset and response.status_code != 206:
+        # The file changed, or the server ignored or couldn't satisfy the
+        # range, so start over
+        hasher = md5()
+        offset = 0
+        if response.status_code == 416:
+            response.close()
+            response = requests.get(feed_url, stream=True)
+    with response:
+        response.raise_for_status()
+        if not offset:
+            validator = get_resume_validator(response)
+            if validator:
+                with open(validator_path, "w") as file:
+                    file.write(validator)
+            elif path.exists(validator_path):
+                remove(validator_path)
+        with open(partial_path, "ab" if offset else "wb") as file:
+            for data in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                hasher.update(data)
+                file.write(data)
+    checksum = hasher.hexdigest()
+    replace(partial_path, target_path)
+    if path.exists(validator_path):
+        remove(validator_path)
+    with open(f"{target_path}.md5", "w") as file:
+        file.write(checksum)
+    return GtfsFeedDownloadResult(url=feed_url, zip_md5_checksum=checksum)
+
+
 def ingest_feed_to_sqlite(
     feed_path: str,
     db_path: str,
     result: GtfsFeedDownloadResult,
     batch_size: Union[None, int] = None,
+    ingest_engine: "IngestEngine" = "sqlalchemy",
+    bulk_build: bool = False,
 ):
     from .ingest import ingest_gtfs_csv_into_db
-    from .session import create_sqlalchemy_session
+    from .session import (
+        create_sqlalchemy_session,
+        dispose_sqlite_engines,
+        finish_bulk_build,
+    )
 
+    # A bulk build always starts from an empty file, and only replaces the db at
+    # db_path once it's complete and indexed
+    build_path = f"{db_path}.building" if bulk_build else db_path
     try:
-        reader = GtfsReader(feed_path)
-        session = create_sqlalchemy_session(db_path)
-        ingest_gtfs_csv_into_db(session, result, reader, batch_size)
+        if bulk_build and path.exists(build_path):
+            remove(build_path)
+        reader = create_gtfs_reader(feed_path)
+        session = create_sqlalchemy_session(build_path, bulk_build=bulk_build)
+        ingest_gtfs_csv_into_db(session, result, reader, batch_size, ingest_engine)
+        if bulk_build:
+            finish_bulk_build(session)
+            replace(build_path, db_path)
+            # Sessions that were already open on db_path still see the old file
+            dispose_sqlite_engines(db_path)
     except Exception as ex:
         try:
-            remove(db_path)
+            remove(build_path)
         except FileNotFoundError:
             pass
         raise ex
 
 
-def compress_sqlite_feed(db_path: str, compact_db_path: str):
-    from .compact import make_compact_db
+def add_entity_digests_to_db(db_path: str, batch_size: Union[None, int] = None):
+    from .ingest import ingest_entity_digests
+    from .models.feed_info import FeedInfo
     from .session import create_sqlalchemy_session
 
+    session = create_sqlalchemy_session(db_path)
     try:
-        copy(db_path, compact_db_path)
-        session = create_sqlalchemy_session(compact_db_path)
-        make_compact_db(session)
-    except Exception as ex:
-        try:
-            remove(compact_db_path)
-        except FileNotFoundError:
-            pass
-        raise ex
+        feed_info = session.query(FeedInfo).order_by(FeedInfo.id.desc()).first()
+        ingest_entity_digests(session, feed_info, batch_size, "executemany")
+        session.commit()
+    finally:
+        session.close()
+        session.get_bind().dispose()
 
 
-def build_local_feed_entry(
-    feed: GtfsFeed,
+def compress_sqlite_feed(
+    db_path: str,
+    compact_db_path: str,
+    compaction_profile: Union[None, "CompactionProfile"] = None,
+):
+    from .compact import DEFAULT_COMPACTION_PROFILE, make_compact_db
+    from .session import dispose_sqlite_engines
+
+    make_compact_db(
+        db_path, compact_db_path, compaction_profile or DEFAULT_COMPACTION_PROFILE
+    )
+    # Sessions that were already open on compact_db_path still see the old file
+    dispose_sqlite_engines(compact_db_path)
+
+
+def columnar_files_exist(local_subdirectory: str) -> bool:
+    return all(
+        path.exists(path.join(local_subdirectory, file)) for file in COLUMNAR_FILES
+    )
+
+
+def build_feed_databases(
+    local_subdirectory: str,
+    result: GtfsFeedDownloadResult,
     compact_only=False,
     rebuild_db=True,
     rebuild_compact_db=True,
     ingest_batch_size: Union[None, int] = None,
+    ingest_engine: "IngestEngine" = "sqlalchemy",
+    bulk_build: bool = False,
+    columnar: bool = False,
+    interned_ids: bool = False,
+    entity_digests: bool = False,
+    compaction_profile: Union[None, "CompactionProfile"] = None,
 ):
-    (zip_path, feed_path, db_path, compact_db_path) = (
-        path.join(feed.local_subdirectory, entity)
-        for entity in ("data.zip", "feed", "gtfs.sqlite3", "gtfs_compact.sqlite3")
-    )
-    download_feed_zip(feed.url, zip_path)
-    unzip_feed(zip_path, feed_path)
-    result = GtfsFeedDownloadResult(
-        url=feed.url,
-        zip_md5_checksum=get_zip_checksum(zip_path),
+    (zip_path, db_path, compact_db_path) = (
+        path.join(local_subdirectory, entity)
+        for entity in ("data.zip", "gtfs.sqlite3", "gtfs_compact.sqlite3")
     )
-    if not path.exists(db_path) or rebuild_db:
-        ingest_feed_to_sqlite(feed_path, db_path, result, ingest_batch_size)
+    built_db = not path.exists(db_path) or rebuild_db
+    if built_db:
+        from .intern import intern_feed_ids, is_db_interned
+        from .session import dispose_sqlite_engines
+
+        # An interned db can only be read through its views, so it can't be
+        # ingested into again
+        if path.exists(db_path) and is_db_interned(db_path):
+            remove(db_path)
+            dispose_sqlite_engines(db_path)
+        ingest_feed_to_sqlite(
+            zip_path, db_path, result, ingest_batch_size, ingest_engine, bulk_build
+        )
+        # These are read from the ingested tables, so they're added before the
+        # ids are interned, and copied into the compact db along with the rest
+        if entity_digests:
+            add_entity_digests_to_db(db_path, ingest_batch_size)
+        if interned_ids:
+            intern_feed_ids(db_path)
+            dispose_sqlite_engines(db_path)
     if not path.exists(compact_db_path) or rebuild_compact_db:
-        compress_sqlite_feed(db_path, compact_db_path)
+        compress_sqlite_feed(db_path, compact_db_path, compaction_profile)
+    if columnar and (built_db or not columnar_files_exist(local_subdirectory)):
+        from .columnar import export_columnar_feed
+
+        # This reads from the full db, so it has to happen before that's removed
+        export_columnar_feed(db_path, local_subdirectory)
     if compact_only:
         remove(db_path)
+
+
+def build_local_feed_entry(
+    feed: GtfsFeed,
+    compact_only=False,
+    rebuild_db=True,
+    rebuild_compact_db=True,
+    ingest_batch_size: Union[None, int] = None,
+    ingest_engine: "IngestEngine" = "sqlalchemy",
+    bulk_build: bool = False,
+    columnar: bool = False,
+    interned_ids: bool = False,
+    entity_digests: bool = False,
+    compaction_profile: Union[None, "CompactionProfile"] = None,
+    force_download: bool = False,
+):
+    zip_path = path.join(feed.local_subdirectory, "data.zip")
+    result = download_feed_zip(feed.url, zip_path, force=force_download)
+    build_feed_databases(
+        feed.local_subdirectory,
+        result,
+        compact_only=compact_only,
+        rebuild_db=rebuild_db,
+        rebuild_compact_db=rebuild_compact_db,
+        ingest_batch_size=ingest_batch_size,
+        ingest_engine=ingest_engine,
+        bulk_build=bulk_build,
+        columnar=columnar,
+        interned_ids=interned_ids,
+        entity_digests=entity_digests,
+        compaction_profile=compaction_profile,
+    )
@@ -0,0 +1,168 @@
+import sqlite3
+from os import path
+from typing import TYPE_CHECKING, Dict, Iterator, Tuple, Type, Union
+
+from sqlalchemy.types import Float, Integer
+
+from .models.base import Base
+from .models.shapes import ShapePoint
+from .models.stop_times import StopTime
+from .models.trips import Trip
+from .utils.files import atomic_write_path
+from .utils.sqlite import connect_read_only, get_db_zip_checksum
+
+if TYPE_CHECKING:
+    import pyarrow
+
+# Each table is written to its own Arrow IPC file, sorted by these columns
+COLUMNAR_TABLES: Dict[str, Tuple[Type[Base], Tuple[str, ...]]] = {
+    "stop_times": (StopTime, ("trip_id", "stop_sequence")),
+    "shapes": (ShapePoint, ("shape_id", "shape_pt_sequence")),
+    "trips": (Trip, ("trip_id",)),
+}
+COLUMNAR_FILE_EXTENSION = ".arrow"
+COLUMNAR_CHECKSUM_KEY = b"zip_md5_checksum"
+COLUMNAR_BATCH_SIZE = 300000
+
+
+def import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.ipc
+    except ImportError as ex:
+        raise ImportError(
+            "Columnar feed files require pyarrow "
+            "(pip install mbta-gtfs-sqlite[columnar])"
+        ) from ex
+    return pyarrow
+
+
+def get_columnar_file_name(table_name: str) -> str:
+    return f"{table_name}{COLUMNAR_FILE_EXTENSION}"
+
+
+def get_columnar_schema(model: Type[Base]) -> "pyarrow.Schema":
+    pa = import_pyarrow()
+    fields = []
+    for column in model.__table__.columns:
+        if column.name in ("id", "feed_info_id"):
+            continue
+        if isinstance(column.type, Integer):
+            # Times are stored as seconds since midnight, which fit in an int32
+            field_type = pa.int32()
+        elif isinstance(column.type, Float):
+            field_type = pa.float64()
+        else:
+            # Ids and enum values repeat a lot, so they're stored once each in a
+            # dictionary and referred to by index
+            field_type = pa.dictionary(pa.int32(), pa.string())
+        fields.append(pa.field(column.name, field_type))
+    return pa.schema(fields)
+
+
+def read_columnar_dictionaries(
+    connection: sqlite3.Connection,
+    model: Type[Base],
+    schema: "pyarrow.Schema",
+) -> Dict[str, "pyarrow.Array"]:
+    # An IPC file can only hold one dictionary per column, so each is read up
+    # front and shared by every batch
+    pa = import_pyarrow()
+    dictionaries = {}
+    for field in schema:
+        if pa.types.is_dictionary(field.type):
+            cursor = connection.execute(
+                f'SELECT DISTINCT {field.name} FROM "{model.__tablename__}" '
+                f"WHERE {field.name} IS NOT NULL ORDER BY {field.name}"
+            )
+            values = [value for (value,) in cursor]
+            cursor.close()
+            dictionaries[field.name] = pa.array(values, pa.string())
+    return dictionaries
+
+
+def read_columnar_batches(
+    connection: sqlite3.Connection,
+    model: Type[Base],
+    order_by: Tuple[str, ...],
+    schema: "pyarrow.Schema",
+) -> Iterator["pyarrow.RecordBatch"]:
+    pa = import_pyarrow()
+    dictionaries = read_columnar_dictionaries(connection, model, schema)
+    cursor = connection.execute(
+        f'SELECT {", ".join(schema.names)} FROM "{model.__tablename__}" '
+        f'ORDER BY {", ".join(order_by)}'
+    )
+    try:
+        while True:
+            rows = cursor.fetchmany(COLUMNAR_BATCH_SIZE)
+            if not rows:
+                break
+            arrays = []
+            for index, field in enumerate(schema):
+                values = [row[index] for row in rows]
+                if pa.types.is_dictionary(field.type):
+                    dictionary = dictionaries[field.name]
+                    indices = pa.compute.index_in(
+                        pa.array(values, pa.string()), value_set=dictionary
+                    )
+                    arrays.append(pa.DictionaryArray.from_arrays(indices, dictionary))
+                else:
+                    arrays.append(pa.array(values, field.type))
+            yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+    finally:
+        cursor.close()
+
+
+def write_columnar_table(
+    connection: sqlite3.Connection,
+    table_name: str,
+    file_path: str,
+    zip_md5_checksum: Union[None, str],
+):
+    pa = import_pyarrow()
+    model, order_by = COLUMNAR_TABLES[table_name]
+    schema = get_columnar_schema(model)
+    if zip_md5_checksum:
+        schema = schema.with_metadata({COLUMNAR_CHECKSUM_KEY: zip_md5_checksum})
+    # Batches are written as they're read, so only one is in memory at a time.
+    # The file is left uncompressed so that it can be memory-mapped and read
+    # without copying.
+    with atomic_write_path(file_path) as temp_path:
+        with pa.OSFile(temp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, schema) as writer:
+                for batch in read_columnar_batches(connection, model, order_by, schema):
+                    writer.write_batch(batch)
+
+
+def export_columnar_feed(db_path: str, target_dir: str):
+    connection = connect_read_only(db_path)
+    try:
+        zip_md5_checksum = get_db_zip_checksum(connection)
+        for table_name in COLUMNAR_TABLES.keys():
+            write_columnar_table(
+                connection,
+                table_name,
+                path.join(target_dir, get_columnar_file_name(table_name)),
+                zip_md5_checksum,
+            )
+    finally:
+        connection.close()
+
+
+def load_columnar_table(file_path: str) -> "pyarrow.Table":
+    # The table's buffers point straight into the memory-mapped file, which
+    # stays mapped for as long as they're referenced
+    pa = import_pyarrow()
+    return pa.ipc.open_file(pa.memory_map(file_path, "r")).read_all()
+
+
+def get_columnar_zip_checksum(file_path: str) -> Union[None, str]:
+    pa = import_pyarrow()
+    if not path.exists(file_path):
+        return None
+    with pa.memory_map(file_path, "r") as source:
+        metadata = pa.ipc.open_file(source).schema.metadata or {}
+    checksum = metadata.get(COLUMNAR_CHECKSUM_KEY)
+    return checksum.decode() if checksum else None
@@ -1,17 +1,179 @@
-from sqlalchemy import text
+from dataclasses import dataclass
+from os import path, remove, replace
+from typing import List, Literal, Tuple, Union
+
+from sqlalchemy import Table, bindparam, insert, select, text
+from sqlalchemy.sql.elements import BindParameter
 from sqlalchemy.orm import Session
 
-from .models.shapes import ShapePoint
+from .models.base import Base
+from .models.daily_trips import DailyTrip
+from .models.routes import RouteType
+from .models.service_dates import ServiceDate
+from .models.shapes import Shape, ShapePoint
 from .models.stop_times import StopTime
+from .models.trips import Trip
+from .spatial import build_spatial_indexes
+from .utils.polyline import decode_polyline, encode_polyline, simplify_polyline
+
+ShapePointsPolicy = Literal["none", "all", "representative"]
+
+DAILY_TRIP_COLUMNS = (
+    "feed_info_id",
+    "date",
+    "route_id",
+    "direction_id",
+    "trip_id",
+    "service_id",
+    "start_time",
+    "end_time",
+    "stop_count",
+)
+
+
+@dataclass
+class CompactionProfile(object):
+    # Stop times are kept for trips on any of these routes, or on any route of
+    # these types. By default none are kept.
+    stop_times_route_ids: Tuple[str, ...] = ()
+    stop_times_route_types: Tuple[RouteType, ...] = ()
+    # Which shape points are kept: none of them, all of them, or only those of
+    # the shapes of each route pattern's representative trip
+    shape_points: ShapePointsPolicy = "none"
+    # Simplifies each Shape's polyline to within this many meters of the
+    # original, or leaves it as it is if zero
+    shape_tolerance: float = 0.0
+    # Whether to fill the DailyTrip table, which has a row per trip per day
+    daily_trips: bool = True
+
+
+DEFAULT_COMPACTION_PROFILE = CompactionProfile()
+SUBWAY_COMPACTION_PROFILE = CompactionProfile(
+    stop_times_route_types=(RouteType.TRAM, RouteType.METRO),
+    shape_points="representative",
+)
+
+
+def get_table_filter(
+    table: Table,
+    profile: CompactionProfile,
+) -> Tuple[Union[None, str], List[BindParameter]]:
+    # Returns a WHERE clause over the attached full db (or None to copy every row)
+    # and the parameters it binds
+    if table is StopTime.__table__:
+        if not profile.stop_times_route_ids and not profile.stop_times_route_types:
+            return "0", []
+        route_types = [
+            route_type.value for route_type in profile.stop_times_route_types
+        ]
+        return (
+            "trip_id IN (SELECT t.trip_id FROM full.Trip t JOIN full.Route r "
+            "ON r.route_id = t.route_id AND r.feed_info_id = t.feed_info_id "
+            "WHERE r.route_id IN :route_ids OR r.route_type IN :route_types)",
+            [
+                bindparam(
+                    "route_ids", list(profile.stop_times_route_ids), expanding=True
+                ),
+                bindparam("route_types", route_types, expanding=True),
+            ],
+        )
+    if table is ShapePoint.__table__:
+        if profile.shape_points == "all":
+            return None, []
+        if profile.shape_points == "representative":
+            return (
+                "shape_id IN (SELECT t.shape_id FROM full.Trip t "
+                "JOIN full.RoutePattern p ON p.representative_trip_id = t.trip_id "
+                "AND p.feed_info_id = t.feed_info_id)",
+                [],
+            )
+        return "0", []
+    return None, []
+
+
+def copy_table_from_full_db(
+    session: Session,
+    table: Table,
+    profile: CompactionProfile,
+):
+    columns = ", ".join(f'"{column.name}"' for column in table.columns)
+    where_clause, params = get_table_filter(table, profile)
+    statement = (
+        f'INSERT INTO main."{table.name}" ({columns}) '
+        f'SELECT {columns} FROM full."{table.name}"'
+    )
+    if where_clause:
+        statement += f" WHERE {where_clause}"
+    session.execute(text(statement).bindparams(*params))
+
+
+def simplify_shapes(session: Session, tolerance: float):
+    for shape in session.query(Shape):
+        points = simplify_polyline(decode_polyline(shape.polyline), tolerance)
+        shape.polyline = encode_polyline(points)
+        shape.point_count = len(points)
+        shape.tolerance = tolerance
+    session.flush()
+
 
+def build_daily_trips(session: Session):
+    session.query(DailyTrip).delete()
+    # Rows are inserted in index order, which keeps the index compact
+    trips_by_date = (
+        select(
+            Trip.feed_info_id,
+            ServiceDate.date,
+            Trip.route_id,
+            Trip.direction_id,
+            Trip.trip_id,
+            Trip.service_id,
+            Trip.start_time,
+            Trip.end_time,
+            Trip.stop_count,
+        )
+        .join(
+            ServiceDate,
+            (ServiceDate.service_id == Trip.service_id)
+            & (ServiceDate.feed_info_id == Trip.feed_info_id),
+        )
+        .order_by(ServiceDate.date, Trip.route_id, Trip.direction_id, Trip.start_time)
+    )
+    session.execute(insert(DailyTrip).from_select(DAILY_TRIP_COLUMNS, trips_by_date))
 
-def vacuum(session: Session):
-    session.commit()
-    session.execute(text("vacuum"))
-    session.commit()
 
+def make_compact_db(
+    db_path: str,
+    compact_db_path: str,
+    profile: CompactionProfile = DEFAULT_COMPACTION_PROFILE,
+):
+    from .session import create_sqlalchemy_session, finish_bulk_build
 
-def make_compact_db(session: Session):
-    session.query(StopTime).delete()
-    session.query(ShapePoint).delete()
-    vacuum(session)
+    # Rather than copying the full db and deleting most of it, the compact db is
+    # written from scratch with only the rows it keeps, and only replaces the
+    # file at compact_db_path once it's complete and indexed
+    build_path = f"{compact_db_path}.building"
+    try:
+        if path.exists(build_path):
+            remove(build_path)
+        session = create_sqlalchemy_session(build_path, bulk_build=True)
+        session.execute(
+            text("ATTACH DATABASE :db_path AS full"), {"db_path": path.abspath(db_path)}
+        )
+        for table in Base.metadata.sorted_tables:
+            if table is not DailyTrip.__table__:
+                copy_table_from_full_db(session, table, profile)
+        if profile.shape_tolerance > 0:
+            simplify_shapes(session, profile.shape_tolerance)
+        build_spatial_indexes(session)
+        if profile.daily_trips:
+            build_daily_trips(session)
+        session.commit()
+        session.execute(text("DETACH DATABASE full"))
+        finish_bulk_build(session)
+        replace(build_path, compact_db_path)
+    except Exception as ex:
+        try:
+            remove(build_path)
+        except FileNotFoundError:
+            pass
+        raise ex
@@ -0,0 +1,142 @@
+import sqlite3
+from os import close, path, remove
+from tempfile import mkstemp
+from typing import BinaryIO, Union
+
+from .utils.files import atomic_write_path
+from .utils.sqlite import connect_read_only, get_db_zip_checksum
+
+# sqlite dbs compress very well, and decompressing zstd is fast enough that it's
+# barely noticeable next to a download
+COMPRESSED_SUFFIX = ".zst"
+DEFAULT_COMPRESSION_LEVEL = 9
+STREAM_CHUNK_SIZE = 1024 * 1024
+# A compressed db keeps the checksum of the zip it was built from in a file next
+# to it, so that checking whether it's up to date doesn't mean decompressing it
+ZIP_CHECKSUM_SUFFIX = ".zip.md5"
+
+
+def is_compressed_path(file_path: str) -> bool:
+    return file_path.endswith(COMPRESSED_SUFFIX)
+
+
+def get_compressed_path(file_path: str) -> str:
+    return file_path + COMPRESSED_SUFFIX
+
+
+def get_zip_checksum_path(compressed_path: str) -> str:
+    return compressed_path + ZIP_CHECKSUM_SUFFIX
+
+
+def write_compressed_db_zip_checksum(db_path: str, compressed_path: str):
+    connection = connect_read_only(db_path)
+    try:
+        checksum = get_db_zip_checksum(connection)
+    except sqlite3.DatabaseError:
+        # Without a checksum, the db is decompressed whenever it's checked
+        checksum = None
+    finally:
+        connection.close()
+    checksum_path = get_zip_checksum_path(compressed_path)
+    if checksum:
+        with open(checksum_path, "w") as file:
+            file.write(checksum)
+    elif path.exists(checksum_path):
+        remove(checksum_path)
+
+
+def read_compressed_db_zip_checksum(compressed_path: str) -> Union[None, str]:
+    checksum_path = get_zip_checksum_path(compressed_path)
+    if not (path.exists(compressed_path) and path.exists(checksum_path)):
+        return None
+    with open(checksum_path, "r") as file:
+        return file.read().strip() or None
+
+
+def import_zstandard():
+    try:
+        import zstandard
+    except ImportError as ex:
+        raise ImportError(
+            "Compressed feed files require zstandard "
+            "(pip install mbta-gtfs-sqlite[compression])"
+        ) from ex
+    return zstandard
+
+
+def compress_stream(source: BinaryIO, target: BinaryIO, level: int):
+    zstandard = import_zstandard()
+    compressor = zstandard.ZstdCompressor(level=level, threads=-1)
+    compressor.copy_stream(source, target, read_size=STREAM_CHUNK_SIZE)
+
+
+def decompress_stream(source: BinaryIO, target: BinaryIO):
+    # Works on any readable stream, like the body of an S3 object, so that a
+    # download is decompressed as it arrives
+    zstandard = import_zstandard()
+    decompressor = zstandard.ZstdDecompressor()
+    decompressor.copy_stream(source, target, read_size=STREAM_CHUNK_SIZE)
+
+
+def compress_file(
+    source_path: str,
+    target_path: str,
+    level: int = DEFAULT_COMPRESSION_LEVEL,
+):
+    with open(source_path, "rb") as source:
+        with atomic_write_path(target_path) as temp_path:
+            with open(temp_path, "wb") as target:
+                compress_stream(source, target, level)
+
+
+def decompress_file(source_path: str, target_path: str):
+    with open(source_path, "rb") as source:
+        with atomic_write_path(target_path) as temp_path:
+            with open(temp_path, "wb") as target:
+                decompress_stream(source, target)
+
+
+class TemporaryDbConnection(sqlite3.Connection):
+    # Removes the decompressed copy of a db that it was opened on once closed
+    temp_path: Union[None, str] = None
+
+    def close(self):
+        super().close()
+        if self.temp_path and path.exists(self.temp_path):
+            remove(self.temp_path)
+
+
+def connect_compressed_db(file_path: str) -> sqlite3.Connection:
+    # zstd frames can't be read from an arbitrary offset, so rather than paging
+    # through the file, the db is decompressed once and queried from the copy.
+    # Nothing written to it would ever reach the file, so it's opened read-only.
+    if not hasattr(sqlite3.Connection, "deserialize"):
+        return connect_decompressed_temp_db(file_path)
+    zstandard = import_zstandard()
+    # While it's loaded, both the decompressed bytes and sqlite's own copy of
+    # them are in memory, so this briefly takes about twice the db's size
+    with open(file_path, "rb") as source:
+        data = zstandard.ZstdDecompressor().stream_reader(source).readall()
+    connection = sqlite3.connect(":memory:", check_same_thread=False)
+    connection.deserialize(data)
+    del data
+    connection.execute("PRAGMA query_only = ON")
+    return connection
+
+
+def connect_decompressed_temp_db(file_path: str) -> sqlite3.Connection:
+    # Before Python 3.11, sqlite3 can't load a db from memory, so it's
+    # decompressed into a temporary file instead
+    handle, temp_path = mkstemp(suffix=".sqlite3")
+    close(handle)
+    try:
+        decompress_file(file_path, temp_path)
+        connection = connect_read_only(
+            temp_path, check_same_thread=False, factory=TemporaryDbConnection
+        )
+    except Exception as ex:
+        remove(temp_path)
+        raise ex
+    connection.temp_path = temp_path
+    connection.execute("PRAGMA query_only = ON")
+    return connection
@@ -0,0 +1,300 @@
+from datetime import date
+from functools import cached_property
+from os import path
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Union
+
+from sqlalchemy import (
+    Column,
+    Date,
+    Index,
+    Integer,
+    LargeBinary,
+    MetaData,
+    String,
+    Table,
+    create_engine,
+    event,
+    func,
+    insert,
+    select,
+    text,
+)
+from sqlalchemy.engine import Connection, Engine, Row
+
+from .feed import DB_FILE
+from .models.base import Base
+from .models.daily_trips import DailyTrip
+from .utils.hashing import get_content_hash
+from .utils.sqlite import get_read_only_uri
+
+if TYPE_CHECKING:
+    from .feed import GtfsFeed
+
+# A consolidated db holds many feeds in one file. Each of its tables mirrors a
+# model's table, except that instead of a feed_info_id, every row is valid for
+# a range of consecutive feeds. A row that doesn't change from one feed to the
+# next is stored once, so the db grows with the amount of change between feeds
+# rather than with the number of feeds.
+VALIDITY_COLUMNS = ("content_hash", "valid_from_feed_id", "valid_to_feed_id")
+
+consolidated_metadata = MetaData()
+
+ConsolidatedFeed = Table(
+    "ConsolidatedFeed",
+    consolidated_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("key", String, nullable=False, unique=True),
+    Column("start_date", Date, nullable=False),
+    Column("end_date", Date, nullable=False),
+)
+
+
+def create_consolidated_table(table: Table) -> Table:
+    consolidated_table = Table(
+        table.name,
+        consolidated_metadata,
+        Column("id", Integer, primary_key=True),
+        *(
+            Column(column.name, column.type, nullable=column.nullable)
+            for column in table.columns
+            if column.name not in ("id", "feed_info_id")
+        ),
+        Column("content_hash", LargeBinary, nullable=False),
+        Column("valid_from_feed_id", Integer, nullable=False),
+        Column("valid_to_feed_id", Integer, nullable=False),
+    )
+    Index(
+        f"ix_{table.name}_valid_to_feed_id_content_hash",
+        consolidated_table.c.valid_to_feed_id,
+        consolidated_table.c.content_hash,
+    )
+    # The model's own indexes still serve the same lookups, which then only have
+    # to pick out the right version of each row
+    for index in table.indexes:
+        column_names = [
+            column.name for column in index.columns if column.name != "feed_info_id"
+        ]
+        if column_names:
+            Index(index.name, *(consolidated_table.c[name] for name in column_names))
+    return consolidated_table
+
+
+# DailyTrip is only built for the compact db
+CONSOLIDATED_TABLES: Dict[str, Table] = {
+    table.name: create_consolidated_table(table)
+    for table in Base.metadata.sorted_tables
+    if table is not DailyTrip.__table__
+}
+
+
+def register_row_hash(dbapi_connection, connection_record):
+    dbapi_connection.create_function(
+        "row_hash", -1, get_content_hash, deterministic=True
+    )
+
+
+def create_consolidated_engine(db_path: str) -> Engine:
+    # URI filenames are enabled so that feed dbs can be attached read-only
+    engine = create_engine(f"sqlite:///{db_path}", connect_args={"uri": True})
+    event.listen(engine, "connect", register_row_hash)
+    consolidated_metadata.create_all(bind=engine)
+    return engine
+
+
+def get_data_column_names(table: Table) -> List[str]:
+    return [
+        column.name
+        for column in table.columns
+        if column.name != "id" and column.name not in VALIDITY_COLUMNS
+    ]
+
+
+def get_attached_table_names(connection: Connection) -> List[str]:
+    # Views count too, so that feeds built with interned ids can be appended
+    rows = connection.execute(
+        text("SELECT name FROM feed.sqlite_master WHERE type IN ('table', 'view')")
+    )
+    return [name for (name,) in rows]
+
+
+def append_table(connection: Connection, table: Table, feed_id: int):
+    column_list = ", ".join(f'"{name}"' for name in get_data_column_names(table))
+    source_column_list = ", ".join(
+        f'source."{name}"' for name in get_data_column_names(table)
+    )
+    # Rows that appear more than once in a feed are only stored once
+    connection.execute(
+        text(
+            "CREATE TEMP TABLE FeedRowHash "
+            "(source_id INTEGER PRIMARY KEY, content_hash BLOB NOT NULL UNIQUE)"
+        )
+    )
+    connection.execute(
+        text(
+            "INSERT OR IGNORE INTO FeedRowHash (source_id, content_hash) "
+            f'SELECT id, row_hash({column_list}) FROM feed."{table.name}" ORDER BY id'
+        )
+    )
+    # Rows that haven't changed since the previous feed are extended to this one
+    connection.execute(
+        text(
+            f'UPDATE "{table.name}" SET valid_to_feed_id = :feed_id '
+            "WHERE valid_to_feed_id = :feed_id - 1 "
+            "AND content_hash IN (SELECT content_hash FROM FeedRowHash)"
+        ),
+        {"feed_id": feed_id},
+    )
+    # ...and every other row is new
+    connection.execute(
+        text(
+            f'INSERT INTO "{table.name}" ({column_list}, content_hash, '
+            f"valid_from_feed_id, valid_to_feed_id) "
+            f"SELECT {source_column_list}, hash.content_hash, :feed_id, :feed_id "
+            f'FROM FeedRowHash hash JOIN feed."{table.name}" source '
+            "ON source.id = hash.source_id WHERE hash.content_hash NOT IN "
+            f'(SELECT content_hash FROM "{table.name}" '
+            "WHERE valid_to_feed_id = :feed_id)"
+        ),
+        {"feed_id": feed_id},
+    )
+    connection.execute(text("DROP TABLE temp.FeedRowHash"))
+
+
+class ConsolidatedDb(object):
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+    @cached_property
+    def engine(self) -> Engine:
+        return create_consolidated_engine(self.db_path)
+
+    def get_table(self, table_name: str) -> Table:
+        table = CONSOLIDATED_TABLES.get(table_name)
+        if table is None:
+            raise ValueError(f"No consolidated table {table_name}")
+        return table
+
+    def get_feed_keys(self) -> List[str]:
+        with self.engine.connect() as connection:
+            query = select(ConsolidatedFeed.c.key).order_by(ConsolidatedFeed.c.id)
+            return list(connection.execute(query).scalars())
+
+    def append_feed(
+        self,
+        key: str,
+        start_date: date,
+        end_date: date,
+        db_path: str,
+    ) -> bool:
+        # Appends the full db of a feed at db_path. Feeds have to be appended in
+        # order, and one that's already in the db is skipped (returning False).
+        if not path.exists(db_path):
+            raise RuntimeError(f"No feed db at {db_path}")
+        with self.engine.connect() as connection:
+            feed_exists = connection.execute(
+                select(ConsolidatedFeed.c.id).where(ConsolidatedFeed.c.key == key)
+            ).first()
+            if feed_exists:
+                return False
+            latest_start_date, latest_feed_id = connection.execute(
+                select(
+                    func.max(ConsolidatedFeed.c.start_date),
+                    func.max(ConsolidatedFeed.c.id),
+                )
+            ).one()
+            if latest_start_date and start_date <= latest_start_date:
+                raise ValueError(
+                    f"Feed {key} starts before the latest feed in {self.db_path}"
+                )
+            feed_id = (latest_feed_id or 0) + 1
+            connection.execute(
+                text("ATTACH DATABASE :db_uri AS feed"),
+                {"db_uri": get_read_only_uri(db_path)},
+            )
+            try:
+                connection.execute(
+                    insert(ConsolidatedFeed).values(
+                        id=feed_id, key=key, start_date=start_date, end_date=end_date
+                    )
+                )
+                feed_table_names = get_attached_table_names(connection)
+                for table in CONSOLIDATED_TABLES.values():
+                    # Feeds built by older versions may be missing newer tables
+                    if table.name in feed_table_names:
+                        append_table(connection, table, feed_id)
+                connection.commit()
+            except Exception as ex:
+                connection.rollback()
+                raise ex
+            finally:
+                connection.execute(text("DETACH DATABASE feed"))
+        return True
+
+    def append_gtfs_feed(self, feed: "GtfsFeed") -> bool:
+        db_path = path.join(feed.local_subdirectory, DB_FILE)
+        if not path.exists(db_path):
+            raise RuntimeError(f"No full db for {feed} in the local archive")
+        return self.append_feed(feed.key, feed.start_date, feed.end_date, db_path)
+
+    def get_feed_id_for_date(self, target_date: date) -> Union[None, int]:
+        # Where feeds overlap, the one that starts latest (the newest) wins
+        with self.engine.connect() as connection:
+            return connection.execute(
+                select(ConsolidatedFeed.c.id)
+                .where(
+                    ConsolidatedFeed.c.start_date <= target_date,
+                    ConsolidatedFeed.c.end_date >= target_date,
+                )
+                .order_by(ConsolidatedFeed.c.start_date.desc())
+                .limit(1)
+            ).scalar()
+
+    def query_as_of(
+        self,
+        table_name: str,
+        target_date: date,
+        order_by: Iterable[str] = (),
+        **filters: Any,
+    ) -> List[Row]:
+        # Returns the rows of a table, as they were in the feed that was active
+        # on target_date, whose columns equal filters
+        feed_id = self.get_feed_id_for_date(target_date)
+        if feed_id is None:
+            return []
+        table = self.get_table(table_name)
+        query = (
+            select(table)
+            .where(
+                table.c.valid_from_feed_id <= feed_id,
+                table.c.valid_to_feed_id >= feed_id,
+                *(table.c[name] == value for name, value in filters.items()),
+            )
+            .order_by(*(table.c[name] for name in order_by))
+        )
+        with self.engine.connect() as connection:
+            return list(connection.execute(query))
+
+    def get_history(self, table_name: str, **filters: Any) -> List[Row]:
+        # Returns every version of the rows whose columns equal filters, with the
+        # keys of the first and last feeds that each was part of
+        table = self.get_table(table_name)
+        valid_from = ConsolidatedFeed.alias("valid_from")
+        valid_to = ConsolidatedFeed.alias("valid_to")
+        query = (
+            select(
+                table,
+                valid_from.c.key.label("valid_from_key"),
+                valid_to.c.key.label("valid_to_key"),
+            )
+            .join(valid_from, valid_from.c.id == table.c.valid_from_feed_id)
+            .join(valid_to, valid_to.c.id == table.c.valid_to_feed_id)
+            .where(*(table.c[name] == value for name, value in filters.items()))
+            .order_by(table.c.valid_from_feed_id, table.c.id)
+        )
+        with self.engine.connect() as connection:
+            return list(connection.execute(query))
+
+    def get_stop_times_for_trip(self, trip_id: str, target_date: date) -> List[Row]:
+        return self.query_as_of(
+            "StopTime", target_date, order_by=["stop_sequence"], trip_id=trip_id
+        )
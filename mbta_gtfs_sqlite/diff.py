@@ -0,0 +1,167 @@
+from dataclasses import dataclass, field
+from itertools import groupby
+from typing import Any, Iterable, Iterator, List, Tuple, Type, Union
+
+from more_itertools import peekable
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .models.base import Base
+from .models.route_patterns import RoutePattern
+from .models.routes import Route
+from .models.shapes import Shape
+from .models.stop_times import StopTime
+from .models.stops import Stop
+from .models.trips import Trip
+
+# Rows are streamed from both dbs in this many at a time, so that a diff only
+# ever holds the ids of what changed in memory
+DIFF_BATCH_SIZE = 10000
+
+EntityContents = Iterator[Tuple[str, Any]]
+
+
+@dataclass
+class EntityDiff(object):
+    # Ids that are only in the newer feed, only in the older one, or in both but
+    # with different contents, in sorted order
+    added: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+
+
+@dataclass
+class FeedDiff(object):
+    routes: EntityDiff
+    route_patterns: EntityDiff
+    stops: EntityDiff
+    trips: EntityDiff
+    shapes: EntityDiff
+
+
+def get_content_columns(model: Type[Base], key_column_name: str = "id"):
+    return [
+        column
+        for column in model.__table__.columns
+        if column.name not in ("id", "feed_info_id", key_column_name)
+    ]
+
+
+def get_entity_contents(
+    session: Session,
+    model: Type[Base],
+    key_column_name: str,
+    feed_info_id: Union[None, int] = None,
+) -> EntityContents:
+    # Yields (id, contents) for every row of a model, ordered by id
+    key_column = model.__table__.columns[key_column_name]
+    query = (
+        select(key_column, *get_content_columns(model, key_column_name))
+        .where(key_column.isnot(None))
+        .order_by(key_column)
+        .execution_options(yield_per=DIFF_BATCH_SIZE)
+    )
+    if feed_info_id is not None:
+        query = query.where(model.feed_info_id == feed_info_id)
+    for key, *contents in session.execute(query):
+        yield key, tuple(contents)
+
+
+def get_trip_contents(
+    session: Session,
+    include_stop_times: bool,
+    feed_info_id: Union[None, int] = None,
+) -> EntityContents:
+    # A trip's contents include its stop times, which are streamed alongside the
+    # trips in the same order and matched up with them as they go by
+    trips = get_entity_contents(session, Trip, "trip_id", feed_info_id)
+    if not include_stop_times:
+        yield from trips
+        return
+    stop_times_query = (
+        select(*get_content_columns(StopTime))
+        .order_by(StopTime.trip_id, StopTime.stop_sequence)
+        .execution_options(yield_per=DIFF_BATCH_SIZE)
+    )
+    if feed_info_id is not None:
+        stop_times_query = stop_times_query.where(StopTime.feed_info_id == feed_info_id)
+    stop_times_by_trip = peekable(
+        groupby(session.execute(stop_times_query), key=lambda row: row.trip_id)
+    )
+    for trip_id, trip_contents in trips:
+        while stop_times_by_trip and stop_times_by_trip.peek()[0] < trip_id:
+            next(stop_times_by_trip)
+        stop_times = ()
+        if stop_times_by_trip and stop_times_by_trip.peek()[0] == trip_id:
+            stop_times = tuple(tuple(row) for row in next(stop_times_by_trip)[1])
+        yield trip_id, (trip_contents, stop_times)
+
+
+def diff_entity_contents(
+    old_contents: Iterable[Tuple[str, Any]],
+    new_contents: Iterable[Tuple[str, Any]],
+) -> EntityDiff:
+    # A merge join over two streams that are both sorted by id
+    diff = EntityDiff()
+    old_contents = peekable(old_contents)
+    new_contents = peekable(new_contents)
+    while old_contents or new_contents:
+        if not new_contents or (
+            old_contents and old_contents.peek()[0] < new_contents.peek()[0]
+        ):
+            diff.removed.append(next(old_contents)[0])
+        elif not old_contents or new_contents.peek()[0] < old_contents.peek()[0]:
+            diff.added.append(next(new_contents)[0])
+        else:
+            key, old = next(old_contents)
+            _, new = next(new_contents)
+            if old != new:
+                diff.changed.append(key)
+    return diff
+
+
+def diff_feeds(
+    old_session: Session,
+    new_session: Session,
+    include_stop_times: bool = True,
+) -> FeedDiff:
+    from .digests import (
+        get_entity_digests,
+        get_route_pattern_contents,
+        has_entity_digests,
+    )
+
+    # Where both dbs have digests of an entity (see digests.py), those are
+    # compared instead of the entities themselves. Trip digests always include
+    # stop times, even in a compact db.
+    def diff_entity(entity_type: str, get_contents):
+        if has_entity_digests(old_session, entity_type) and has_entity_digests(
+            new_session, entity_type
+        ):
+            return diff_entity_contents(
+                get_entity_digests(old_session, entity_type),
+                get_entity_digests(new_session, entity_type),
+            )
+        return diff_entity_contents(
+            get_contents(old_session), get_contents(new_session)
+        )
+
+    def diff_model(model: Type[Base], key_column_name: str):
+        return diff_entity_contents(
+            get_entity_contents(old_session, model, key_column_name),
+            get_entity_contents(new_session, model, key_column_name),
+        )
+
+    return FeedDiff(
+        routes=diff_model(Route, "route_id"),
+        route_patterns=diff_entity("route_pattern", get_route_pattern_contents),
+        stops=diff_model(Stop, "stop_id"),
+        trips=diff_entity(
+            "trip",
+            lambda session: get_trip_contents(session, include_stop_times),
+        ),
+        shapes=diff_entity(
+            "shape",
+            lambda session: get_entity_contents(session, Shape, "shape_id"),
+        ),
+    )
@@ -0,0 +1,154 @@
+from itertools import groupby
+from typing import Any, Dict, Iterable, Type, Union
+
+from sqlalchemy import inspect, select
+from sqlalchemy.orm import Session
+
+from .diff import get_entity_contents, get_trip_contents
+from .reader import GtfsReader
+from .models.base import Base
+from .models.calendar import CalendarService
+from .models.calendar_attributes import CalendarAttribute
+from .models.calendar_dates import CalendarServiceException
+from .models.digests import EntityDigest, EntityDigestType, FeedFileDigest
+from .models.feed_info import FeedInfo
+from .models.lines import Line
+from .models.route_patterns import RoutePattern
+from .models.routes import Route
+from .models.shapes import Shape, ShapePoint
+from .models.stop_times import StopTime
+from .models.stops import Stop
+from .models.transfers import Transfer
+from .models.trips import Trip
+from .utils.hashing import get_content_hash
+
+# The model that each file of a feed is ingested into
+GTFS_FILE_MODELS: Dict[str, Type[Base]] = {
+    "calendar": CalendarService,
+    "calendar_attributes": CalendarAttribute,
+    "calendar_dates": CalendarServiceException,
+    "feed_info": FeedInfo,
+    "lines": Line,
+    "route_patterns": RoutePattern,
+    "routes": Route,
+    "shapes": ShapePoint,
+    "stop_times": StopTime,
+    "stops": Stop,
+    "transfers": Transfer,
+    "trips": Trip,
+}
+
+
+def get_feed_file_digest_rows(reader: GtfsReader) -> Iterable[Dict[str, Any]]:
+    for file_name in GTFS_FILE_MODELS.keys():
+        file_digest = reader.get_file_digest(file_name)
+        if file_digest:
+            sha256, row_count = file_digest
+            yield {"file_name": file_name, "sha256": sha256, "row_count": row_count}
+
+
+def get_feed_file_digests(reader: GtfsReader) -> Dict[str, str]:
+    return {
+        row["file_name"]: row["sha256"] for row in get_feed_file_digest_rows(reader)
+    }
+
+
+def get_route_pattern_contents(
+    session: Session,
+    feed_info_id: Union[None, int] = None,
+):
+    # A route pattern's contents include the stops of its representative trip
+    representative_trip_ids = select(
+        RoutePattern.route_pattern_id, RoutePattern.representative_trip_id
+    )
+    stop_ids = select(StopTime.trip_id, StopTime.stop_id).where(
+        StopTime.trip_id.in_(
+            representative_trip_ids.with_only_columns(
+                RoutePattern.representative_trip_id
+            )
+        )
+    )
+    if feed_info_id is not None:
+        representative_trip_ids = representative_trip_ids.where(
+            RoutePattern.feed_info_id == feed_info_id
+        )
+        stop_ids = stop_ids.where(StopTime.feed_info_id == feed_info_id)
+    trip_ids_by_route_pattern = dict(session.execute(representative_trip_ids).all())
+    stop_ids_by_trip = {
+        trip_id: tuple(stop_id for _, stop_id in rows)
+        for trip_id, rows in groupby(
+            session.execute(
+                stop_ids.order_by(StopTime.trip_id, StopTime.stop_sequence)
+            ),
+            key=lambda row: row[0],
+        )
+    }
+    route_patterns = get_entity_contents(
+        session, RoutePattern, "route_pattern_id", feed_info_id
+    )
+    for route_pattern_id, contents in route_patterns:
+        trip_id = trip_ids_by_route_pattern.get(route_pattern_id)
+        yield route_pattern_id, (contents, stop_ids_by_trip.get(trip_id, ()))
+
+
+def get_entity_digest_rows(
+    session: Session,
+    feed_info_id: Union[None, int] = None,
+) -> Iterable[Dict[str, Any]]:
+    contents_by_entity_type = {
+        "trip": get_trip_contents(session, True, feed_info_id),
+        "shape": get_entity_contents(session, Shape, "shape_id", feed_info_id),
+        "route_pattern": get_route_pattern_contents(session, feed_info_id),
+    }
+    for entity_type, entity_contents in contents_by_entity_type.items():
+        for entity_id, contents in entity_contents:
+            yield {
+                "entity_type": entity_type,
+                "entity_id": entity_id,
+                "digest": get_content_hash(contents),
+            }
+
+
+def has_entity_digests(session: Session, entity_type: EntityDigestType) -> bool:
+    # Dbs that were built before digests were added don't have the table at all
+    if not inspect(session.connection()).has_table(EntityDigest.__tablename__):
+        return False
+    digest = session.execute(
+        select(EntityDigest.id).where(EntityDigest.entity_type == entity_type)
+    ).first()
+    return digest is not None
+
+
+def get_entity_digests(session: Session, entity_type: EntityDigestType):
+    # Yields (id, digest) for every entity of a type, ordered by id
+    query = (
+        select(EntityDigest.entity_id, EntityDigest.digest)
+        .where(EntityDigest.entity_type == entity_type)
+        .order_by(EntityDigest.entity_id)
+    )
+    for entity_id, digest in session.execute(query):
+        yield entity_id, digest
+
+
+def get_stored_feed_file_digests(session: Session) -> Dict[str, str]:
+    if not inspect(session.connection()).has_table(FeedFileDigest.__tablename__):
+        return {}
+    query = select(FeedFileDigest.file_name, FeedFileDigest.sha256)
+    return {file_name: sha256 for file_name, sha256 in session.execute(query)}
+
+
+def find_row_count_mismatches(session: Session) -> Dict[str, Dict[str, int]]:
+    # Compares the number of rows of each file with the number in its table, for
+    # a quick integrity check of a full db
+    mismatches = {}
+    for file_digest in session.query(FeedFileDigest):
+        model = GTFS_FILE_MODELS.get(file_digest.file_name)
+        if model is None:
+            continue
+        row_count = session.query(model).count()
+        if row_count != file_digest.row_count:
+            mismatches[file_digest.file_name] = {
+                "expected": file_digest.row_count,
+                "actual": row_count,
+            }
+    return mismatches
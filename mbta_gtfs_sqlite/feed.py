@@ -1,4 +1,4 @@
-from typing import TYPE_CHECKING, Union
+from typing import TYPE_CHECKING, Any, Dict, Union
 from os import path, mkdir, remove, rmdir
 from datetime import date
 from dataclasses import dataclass
@@ -7,10 +7,14 @@ from functools import cached_property
 
 if TYPE_CHECKING:
     from .archive import MbtaGtfsArchive
+    from .compact import CompactionProfile
+    from .ingest import IngestEngine
 
 DB_FILE = "gtfs.sqlite3"
 DB_COMPACT_FILE = "gtfs_compact.sqlite3"
 ALL_DB_FILES = [DB_FILE, DB_COMPACT_FILE]
+COLUMNAR_FILES = ["stop_times.arrow", "shapes.arrow", "trips.arrow"]
+TIMETABLE_FILE = "timetable.npz"
 DEFAULT_INGEST_BATCH_SIZE = 300000
 
 @dataclass
@@ -24,6 +28,11 @@ class GtfsFeed(object):
 
     def __post_init__(self):
         self.compact_only = False
+        self.columnar = False
+        self.interned_ids = False
+        self.entity_digests = False
+        self.compressed = False
+        self.compaction_profile: Union[None, "CompactionProfile"] = None
 
     def __repr__(self):
         return f"GtfsFeed({self.key})"
@@ -33,38 +42,62 @@ class GtfsFeed(object):
         return path.join(self.archive.local_archive_path, self.key)
 
     def required_feed_files(self):
-        return ALL_DB_FILES if not self.compact_only else [DB_COMPACT_FILE]
+        db_files = ALL_DB_FILES if not self.compact_only else [DB_COMPACT_FILE]
+        return db_files + COLUMNAR_FILES if self.columnar else db_files
 
     def use_compact_only(self, enabled: bool = True):
         self.compact_only = enabled
 
+    def use_columnar(self, enabled: bool = True):
+        self.columnar = enabled
+
+    def use_interned_ids(self, enabled: bool = True):
+        self.interned_ids = enabled
+
+    def use_entity_digests(self, enabled: bool = True):
+        self.entity_digests = enabled
+
+    def use_compression(self, enabled: bool = True):
+        self.compressed = enabled
+
+    def use_compaction_profile(self, profile: Union[None, "CompactionProfile"]):
+        self.compaction_profile = profile
+
     def ensure_subdirectory(self):
         if not path.exists(self.archive.local_archive_path):
             mkdir(self.archive.local_archive_path)
         if not path.exists(self.local_subdirectory):
             mkdir(self.local_subdirectory)
 
+    def get_local_file_path(self, file: str):
+        # Prefers an uncompressed copy of the file, if there is one
+        from .compression import get_compressed_path
+
+        file_path = path.join(self.local_subdirectory, file)
+        compressed_path = get_compressed_path(file_path)
+        if not path.exists(file_path) and path.exists(compressed_path):
+            return compressed_path
+        return file_path
+
     def exists_locally(self):
         for file in self.required_feed_files():
-            if not path.exists(path.join(self.local_subdirectory, file)):
+            if not path.exists(self.get_local_file_path(file)):
                 return False
         return True
 
     def exists_remotely(self):
-        try:
-            remote_objects = self.archive.s3_bucket.objects.filter(Prefix=self.key)
-        except RuntimeError:
-            return False
-        for file in self.required_feed_files():
-            if not any(obj.key.endswith(file) for obj in remote_objects):
-                return False
-        return True
+        from .transfer import feed_exists_remotely
+
+        return feed_exists_remotely(self)
 
     def build_locally(
         self,
         rebuild_db: bool = True,
         rebuild_compact_db: bool = True,
         ingest_batch_size: Union[None, int] = DEFAULT_INGEST_BATCH_SIZE,
+        ingest_engine: "IngestEngine" = "sqlalchemy",
+        bulk_build: bool = False,
+        force_download: bool = False,
     ):
         from .build import build_local_feed_entry
 
@@ -75,24 +108,67 @@ class GtfsFeed(object):
             rebuild_db=rebuild_db,
             rebuild_compact_db=rebuild_compact_db,
             ingest_batch_size=ingest_batch_size,
+            ingest_engine=ingest_engine,
+            bulk_build=bulk_build,
+            columnar=self.columnar,
+            interned_ids=self.interned_ids,
+            entity_digests=self.entity_digests,
+            compaction_profile=self.compaction_profile,
+            force_download=force_download,
         )
 
     def download_from_s3(self):
-        if not self.exists_remotely():
-            raise RuntimeError("Feed does not exist remotely")
-        self.ensure_subdirectory()
-        for file in self.required_feed_files():
-            self.archive.s3_bucket.download_file(
-                f"{self.key}/{file}", path.join(self.local_subdirectory, file)
-            )
+        from .transfer import download_feeds
+
+        download_feeds([self])
 
     def upload_to_s3(self):
-        if not self.exists_locally():
-            raise RuntimeError("Feed does not exist locally")
-        for file in self.required_feed_files():
-            self.archive.s3_bucket.upload_file(
-                path.join(self.local_subdirectory, file), f"{self.key}/{file}"
-            )
+        from .transfer import upload_feeds
+
+        upload_feeds([self])
+
+    def compress_locally(self, level: Union[None, int] = None):
+        # Replaces the local dbs with zstd-compressed copies, which can still be
+        # queried (read-only) by decompressing them into memory
+        from .compression import (
+            DEFAULT_COMPRESSION_LEVEL,
+            compress_file,
+            get_compressed_path,
+            write_compressed_db_zip_checksum,
+        )
+        from .session import dispose_sqlite_engines
+
+        for file in ALL_DB_FILES:
+            file_path = path.join(self.local_subdirectory, file)
+            if path.exists(file_path):
+                dispose_sqlite_engines(file_path)
+                compressed_path = get_compressed_path(file_path)
+                compress_file(
+                    file_path,
+                    compressed_path,
+                    level if level is not None else DEFAULT_COMPRESSION_LEVEL,
+                )
+                write_compressed_db_zip_checksum(file_path, compressed_path)
+                remove(file_path)
+
+    def decompress_locally(self):
+        from .compression import (
+            decompress_file,
+            get_compressed_path,
+            get_zip_checksum_path,
+        )
+        from .session import dispose_sqlite_engines
+
+        for file in ALL_DB_FILES:
+            file_path = path.join(self.local_subdirectory, file)
+            compressed_path = get_compressed_path(file_path)
+            if path.exists(compressed_path):
+                dispose_sqlite_engines(compressed_path)
+                decompress_file(compressed_path, file_path)
+                remove(compressed_path)
+                checksum_path = get_zip_checksum_path(compressed_path)
+                if path.exists(checksum_path):
+                    remove(checksum_path)
 
     def download_or_build(self):
         if self.exists_locally():
@@ -105,27 +181,142 @@ class GtfsFeed(object):
     def delete_locally(self):
         if not self.exists_locally():
             raise RuntimeError("Feed does not exist locally")
-        for file in self.required_feed_files():
+        from .compression import get_compressed_path, get_zip_checksum_path
+        from .session import dispose_sqlite_engines
+
+        for file in [*self.required_feed_files(), TIMETABLE_FILE]:
             file_path = path.join(self.local_subdirectory, file)
-            if path.exists(file_path):
-                remove(file_path)
+            compressed_path = get_compressed_path(file_path)
+            for local_path in (file_path, compressed_path):
+                dispose_sqlite_engines(local_path)
+                if path.exists(local_path):
+                    remove(local_path)
+            checksum_path = get_zip_checksum_path(compressed_path)
+            if path.exists(checksum_path):
+                remove(checksum_path)
         try:
             rmdir(self.local_subdirectory)
         except OSError:
             pass
 
-    def create_sqlite_session(self, compact=None):
+    def create_sqlite_session(
+        self,
+        compact=None,
+        read_only: bool = False,
+        serving: bool = False,
+        engine_options: Union[None, Dict[str, Any]] = None,
+    ):
         if compact is None:
             compact = self.compact_only
         if not self.exists_locally():
             raise RuntimeError("Feed does not exist locally")
         from .session import create_sqlalchemy_session
 
-        db_path = path.join(
-            self.local_subdirectory,
-            "gtfs_compact.sqlite3" if compact else "gtfs.sqlite3",
+        db_path = self.get_local_file_path(DB_COMPACT_FILE if compact else DB_FILE)
+        return create_sqlalchemy_session(
+            db_path,
+            read_only=read_only,
+            serving=serving,
+            reuse_engine=True,
+            engine_options=engine_options,
         )
-        return create_sqlalchemy_session(db_path)
+
+    def load_columnar_table(self, table_name: str):
+        file_name = f"{table_name}.arrow"
+        if file_name not in COLUMNAR_FILES:
+            raise ValueError(f"No columnar file for {table_name}")
+        file_path = path.join(self.local_subdirectory, file_name)
+        if not path.exists(file_path):
+            raise RuntimeError("Columnar file does not exist locally")
+        from .columnar import load_columnar_table
+
+        return load_columnar_table(file_path)
+
+    def get_nearest_stops(self, lat: float, lon: float, count: int = 1, compact=None):
+        from .spatial import get_nearest_stops
+
+        session = self.create_sqlite_session(compact=compact, read_only=True)
+        try:
+            return get_nearest_stops(session, lat, lon, count)
+        finally:
+            session.close()
+
+    def get_stops_within_radius(
+        self,
+        lat: float,
+        lon: float,
+        radius: float,
+        compact=None,
+    ):
+        from .spatial import get_stops_within_radius
+
+        session = self.create_sqlite_session(compact=compact, read_only=True)
+        try:
+            return get_stops_within_radius(session, lat, lon, radius)
+        finally:
+            session.close()
+
+    def snap_to_shape(
+        self,
+        lat: float,
+        lon: float,
+        shape_id: Union[None, str] = None,
+        compact=None,
+    ):
+        from .spatial import snap_to_shape
+
+        session = self.create_sqlite_session(compact=compact, read_only=True)
+        try:
+            return snap_to_shape(session, lat, lon, shape_id)
+        finally:
+            session.close()
+
+    def get_shape_array(self, shape_id: str, compact=None):
+        from .models.shapes import Shape
+        from .utils.polyline import decode_polyline_to_array
+
+        session = self.create_sqlite_session(compact=compact, read_only=True)
+        try:
+            shape = session.query(Shape).filter(Shape.shape_id == shape_id).first()
+        finally:
+            session.close()
+        if shape is None:
+            return None
+        return decode_polyline_to_array(shape.polyline)
+
+    def diff(self, other: "GtfsFeed", compact=None):
+        # Compares this feed to a newer one. Without stored digests, a compact db
+        # only has some stop times (if any), so trips are compared with their
+        # stop times only when both full dbs are used.
+        from .diff import diff_feeds
+
+        if compact is None:
+            compact = self.compact_only or other.compact_only
+        session = self.create_sqlite_session(compact=compact, read_only=True)
+        other_session = other.create_sqlite_session(compact=compact, read_only=True)
+        try:
+            return diff_feeds(session, other_session, include_stop_times=not compact)
+        finally:
+            session.close()
+            other_session.close()
+
+    def get_service_calendar(self):
+        from .service_calendar import create_service_calendar
+
+        session = self.create_sqlite_session(read_only=True)
+        try:
+            return create_service_calendar(session)
+        finally:
+            session.close()
+
+    def load_timetable(self, use_cache: bool = True):
+        from .timetable import load_timetable
+
+        db_path = path.join(self.local_subdirectory, DB_FILE)
+        cache_path = path.join(self.local_subdirectory, TIMETABLE_FILE)
+        if not path.exists(db_path) and not path.exists(cache_path):
+            raise RuntimeError("Feed does not exist locally with its stop times")
+        return load_timetable(db_path, cache_path if use_cache else None)
 
     def matches_date_range(
         self,
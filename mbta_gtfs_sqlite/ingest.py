@@ -1,21 +1,29 @@
+from dataclasses import dataclass
+from itertools import groupby
+from sqlalchemy.engine import Dialect
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from typing import Dict, Any, Callable, List, Type, Iterable, Union
+from typing import Dict, Any, Callable, Literal, Tuple, Type, Iterable, Union
 from more_itertools import ichunked
 
 from .build import GtfsFeedDownloadResult
+from .digests import get_entity_digest_rows, get_feed_file_digest_rows
 from .reader import GtfsReader
+from .service_calendar import create_service_calendar, get_service_date_rows
+from .spatial import build_spatial_indexes
+from .utils.polyline import encode_polyline
 from .utils.time import date_from_string, seconds_from_string
-from .utils.decorators import listify
-from .utils.indexes import bucket_by
 from .models.base import Base
 from .models.calendar_attributes import CalendarAttribute
 from .models.calendar_dates import CalendarServiceException
 from .models.calendar import CalendarService
+from .models.digests import EntityDigest, FeedFileDigest
 from .models.feed_info import FeedInfo
 from .models.lines import Line
 from .models.route_patterns import RoutePattern
 from .models.routes import Route
-from .models.shapes import ShapePoint
+from .models.service_dates import ServiceDate
+from .models.shapes import Shape, ShapePoint
 from .models.stops import Stop
 from .models.stop_times import StopTime
 from .models.transfers import Transfer
@@ -23,6 +31,7 @@ from .models.trips import Trip
 
 RowTransform = Callable[[str], any]
 RowTransforms = Dict[str, RowTransform]
+IngestEngine = Literal["sqlalchemy", "executemany", "parallel"]
 
 
 def nullable(transform: RowTransform) -> RowTransform:
@@ -34,6 +43,51 @@ def nullable(transform: RowTransform) -> RowTransform:
     return inner_transform
 
 
+CALENDAR_TRANSFORMS: RowTransforms = {
+    "start_date": date_from_string,
+    "end_date": date_from_string,
+}
+
+CALENDAR_DATES_TRANSFORMS: RowTransforms = {
+    "date": date_from_string,
+}
+
+CALENDAR_ATTRIBUTES_TRANSFORMS: RowTransforms = {
+    "rating_start_date": nullable(date_from_string),
+    "rating_end_date": nullable(date_from_string),
+}
+
+SHAPES_TRANSFORMS: RowTransforms = {
+    "shape_pt_lat": float,
+    "shape_pt_lon": float,
+    "shape_pt_sequence": int,
+    "shape_dist_traveled": nullable(float),
+}
+
+STOPS_TRANSFORMS: RowTransforms = {
+    "stop_lat": nullable(float),
+    "stop_lon": nullable(float),
+}
+
+TRANSFERS_TRANSFORMS: RowTransforms = {
+    "min_transfer_time": nullable(int),
+    "min_walk_time": nullable(int),
+    "min_wheelchair_time": nullable(int),
+    "suggested_buffer_time": nullable(int),
+}
+
+STOP_TIMES_TRANSFORMS: RowTransforms = {
+    "arrival_time": seconds_from_string,
+    "departure_time": seconds_from_string,
+    "stop_sequence": int,
+}
+
+TRIPS_TRANSFORMS: RowTransforms = {
+    "start_time": seconds_from_string,
+    "end_time": seconds_from_string,
+}
+
+
 def transform_row_dict(
     row_dict: Dict[str, str],
     transforms: RowTransforms,
@@ -46,22 +100,73 @@ def transform_row_dict(
     }
 
 
-@listify
+class TripStopTimesSummary(object):
+    # Only the first and last stops of each trip are kept around, so that memory
+    # use while ingesting scales with the number of trips, not stop times
+    __slots__ = (
+        "first_stop_sequence",
+        "first_arrival_time",
+        "last_stop_sequence",
+        "last_arrival_time",
+        "stop_count",
+    )
+
+    def __init__(self, stop_sequence: int, arrival_time: str):
+        self.first_stop_sequence = stop_sequence
+        self.first_arrival_time = arrival_time
+        self.last_stop_sequence = stop_sequence
+        self.last_arrival_time = arrival_time
+        self.stop_count = 1
+
+    def add_stop_time(self, stop_sequence: int, arrival_time: str):
+        if stop_sequence < self.first_stop_sequence:
+            self.first_stop_sequence = stop_sequence
+            self.first_arrival_time = arrival_time
+        if stop_sequence > self.last_stop_sequence:
+            self.last_stop_sequence = stop_sequence
+            self.last_arrival_time = arrival_time
+        self.stop_count += 1
+
+    def merge(self, other: "TripStopTimesSummary"):
+        if other.first_stop_sequence < self.first_stop_sequence:
+            self.first_stop_sequence = other.first_stop_sequence
+            self.first_arrival_time = other.first_arrival_time
+        if other.last_stop_sequence > self.last_stop_sequence:
+            self.last_stop_sequence = other.last_stop_sequence
+            self.last_arrival_time = other.last_arrival_time
+        self.stop_count += other.stop_count
+
+
+TripStopTimesSummaries = Dict[str, TripStopTimesSummary]
+
+
+def summarize_stop_time_rows(
+    stop_time_rows: Iterable[Dict[str, str]],
+    summaries: TripStopTimesSummaries,
+) -> Iterable[Dict[str, str]]:
+    for stop_time_row in stop_time_rows:
+        trip_id = stop_time_row["trip_id"]
+        stop_sequence = int(stop_time_row["stop_sequence"])
+        arrival_time = stop_time_row["arrival_time"]
+        summary = summaries.get(trip_id)
+        if summary is None:
+            summaries[trip_id] = TripStopTimesSummary(stop_sequence, arrival_time)
+        else:
+            summary.add_stop_time(stop_sequence, arrival_time)
+        yield stop_time_row
+
+
 def get_trip_rows_with_extra_time_fields(
-    trip_rows: List[Dict[str, str]],
-    stop_time_rows: List[Dict[str, str]],
-) -> List[Dict[str, str]]:
-    stop_times_by_trip_id = bucket_by(stop_time_rows, "trip_id")
+    trip_rows: Iterable[Dict[str, str]],
+    summaries: TripStopTimesSummaries,
+) -> Iterable[Dict[str, str]]:
     for trip_row in trip_rows:
-        stop_times_for_trip = sorted(
-            stop_times_by_trip_id[trip_row["trip_id"]],
-            key=lambda stop_time: int(stop_time["stop_sequence"]),
-        )
+        summary = summaries[trip_row["trip_id"]]
         yield {
             **trip_row,
-            "start_time": stop_times_for_trip[0]["arrival_time"],
-            "end_time": stop_times_for_trip[-1]["arrival_time"],
-            "stop_count": len(stop_times_for_trip),
+            "start_time": summary.first_arrival_time,
+            "end_time": summary.last_arrival_time,
+            "stop_count": summary.stop_count,
         }
 
 
@@ -93,18 +198,77 @@ def ingest_feed_info(
     return feed_info
 
 
-def ingest_rows(
+@dataclass
+class CompiledRowInsert(object):
+    statement: str
+    column_names: Tuple[str, ...]
+    column_transforms: Tuple[Callable[[Union[None, str]], Any], ...]
+
+    def row_to_tuple(self, row_dict: Dict[str, str], feed_info_id: int) -> Tuple:
+        return (
+            *(
+                transform(row_dict.get(name))
+                for name, transform in zip(self.column_names, self.column_transforms)
+            ),
+            feed_info_id,
+        )
+
+
+def compile_column_transform(
+    transform: Union[None, RowTransform],
+    bind_processor: Union[None, Callable[[Any], Any]],
+) -> Callable[[Union[None, str]], Any]:
+    def column_transform(val: Union[None, str]):
+        if val is None:
+            return None
+        if transform:
+            val = transform(val)
+        if bind_processor:
+            val = bind_processor(val)
+        return val
+
+    return column_transform
+
+
+def compile_row_insert(
+    model: Type[Base],
+    transforms: RowTransforms,
+    dialect: Dialect,
+) -> CompiledRowInsert:
+    # Work out the column order, value transforms and SQL type conversions once
+    # per model, rather than once per row like transform_row_dict does
+    table = model.__table__
+    columns = [
+        column for column in table.columns if column.name not in ("id", "feed_info_id")
+    ]
+    preparer = dialect.identifier_preparer
+    quoted_names = [preparer.quote(column.name) for column in columns]
+    quoted_names.append(preparer.quote("feed_info_id"))
+    statement = "INSERT INTO {} ({}) VALUES ({})".format(
+        preparer.format_table(table),
+        ", ".join(quoted_names),
+        ", ".join("?" for _ in quoted_names),
+    )
+    return CompiledRowInsert(
+        statement=statement,
+        column_names=tuple(column.name for column in columns),
+        column_transforms=tuple(
+            compile_column_transform(
+                transforms.get(column.name),
+                column.type.dialect_impl(dialect).bind_processor(dialect),
+            )
+            for column in columns
+        ),
+    )
+
+
+def ingest_rows_with_sqlalchemy(
     session: Session,
     model: Type[Base],
     feed_info: FeedInfo,
-    rows: Iterable[Dict[str, str]],
-    batch_size: Union[None, int],
-    transforms: RowTransforms = {},
+    batches: Iterable[Iterable[Dict[str, str]]],
+    transforms: RowTransforms,
 ):
-    if batch_size:
-        batches = ichunked(rows, batch_size)
-    else:
-        batches = [rows]
     for batch in batches:
         mappings = (
             {
@@ -116,11 +280,133 @@ def ingest_rows(
         session.bulk_insert_mappings(model, mappings)
 
 
-def get_augmented_trip_rows(reader: GtfsReader):
-    stop_times = list(reader.read_stop_times())
-    trips = list(reader.read_trips())
-    trip_rows = get_trip_rows_with_extra_time_fields(trips, stop_times)
-    return trip_rows
+def ingest_rows_with_executemany(
+    session: Session,
+    model: Type[Base],
+    feed_info: FeedInfo,
+    batches: Iterable[Iterable[Dict[str, str]]],
+    transforms: RowTransforms,
+):
+    compiled = compile_row_insert(model, transforms, session.get_bind().dialect)
+    feed_info_id = feed_info.id
+    # Rows go straight to the DBAPI connection that backs the session, so they
+    # share its transaction and are committed along with everything else
+    cursor = session.connection().connection.cursor()
+    try:
+        for batch in batches:
+            cursor.executemany(
+                compiled.statement,
+                (compiled.row_to_tuple(row, feed_info_id) for row in batch),
+            )
+    finally:
+        cursor.close()
+
+
+def ingest_rows(
+    session: Session,
+    model: Type[Base],
+    feed_info: FeedInfo,
+    rows: Iterable[Dict[str, str]],
+    batch_size: Union[None, int],
+    transforms: RowTransforms = {},
+    ingest_engine: IngestEngine = "sqlalchemy",
+):
+    if batch_size:
+        batches = ichunked(rows, batch_size)
+    else:
+        batches = [rows]
+    if ingest_engine == "sqlalchemy":
+        ingest_rows_with_sqlalchemy(session, model, feed_info, batches, transforms)
+    elif ingest_engine == "executemany":
+        ingest_rows_with_executemany(session, model, feed_info, batches, transforms)
+    else:
+        raise ValueError(f"Unknown ingest engine: {ingest_engine}")
+
+
+def get_shape_rows(session: Session, feed_info: FeedInfo) -> Iterable[Dict[str, Any]]:
+    # Reads back the points that were just ingested, so this works the same way
+    # for every ingest engine
+    shape_points = session.execute(
+        select(ShapePoint.shape_id, ShapePoint.shape_pt_lat, ShapePoint.shape_pt_lon)
+        .filter(ShapePoint.feed_info_id == feed_info.id)
+        .order_by(ShapePoint.shape_id, ShapePoint.shape_pt_sequence)
+    )
+    for shape_id, rows in groupby(shape_points, key=lambda row: row[0]):
+        points = [(lat, lon) for _, lat, lon in rows]
+        yield {
+            "shape_id": shape_id,
+            "polyline": encode_polyline(points),
+            "point_count": len(points),
+            "tolerance": 0.0,
+        }
+
+
+def ingest_shapes(
+    session: Session,
+    feed_info: FeedInfo,
+    batch_size: Union[None, int],
+    ingest_engine: IngestEngine = "sqlalchemy",
+):
+    ingest_rows(
+        session=session,
+        model=Shape,
+        feed_info=feed_info,
+        rows=get_shape_rows(session, feed_info),
+        batch_size=batch_size,
+        ingest_engine=ingest_engine,
+    )
+
+
+def ingest_service_dates(
+    session: Session,
+    feed_info: FeedInfo,
+    batch_size: Union[None, int],
+    ingest_engine: IngestEngine = "sqlalchemy",
+):
+    calendar = create_service_calendar(session, feed_info.id)
+    ingest_rows(
+        session=session,
+        model=ServiceDate,
+        feed_info=feed_info,
+        rows=get_service_date_rows(calendar),
+        batch_size=batch_size,
+        ingest_engine=ingest_engine,
+    )
+
+
+def ingest_feed_file_digests(
+    session: Session,
+    feed_info: FeedInfo,
+    reader: GtfsReader,
+    batch_size: Union[None, int],
+    ingest_engine: IngestEngine = "sqlalchemy",
+):
+    ingest_rows(
+        session=session,
+        model=FeedFileDigest,
+        feed_info=feed_info,
+        rows=get_feed_file_digest_rows(reader),
+        batch_size=batch_size,
+        ingest_engine=ingest_engine,
+    )
+
+
+def ingest_entity_digests(
+    session: Session,
+    feed_info: FeedInfo,
+    batch_size: Union[None, int],
+    ingest_engine: IngestEngine = "sqlalchemy",
+):
+    # This reads back every trip, stop time, shape and route pattern of the
+    # feed, so it only runs for feeds that ask for it
+    ingest_rows(
+        session=session,
+        model=EntityDigest,
+        feed_info=feed_info,
+        rows=get_entity_digest_rows(session, feed_info.id),
+        batch_size=batch_size,
+        ingest_engine=ingest_engine,
+    )
 
 
 def ingest_gtfs_csv_into_db(
@@ -128,7 +414,14 @@ def ingest_gtfs_csv_into_db(
     download: GtfsFeedDownloadResult,
     reader: GtfsReader,
     batch_size: Union[None, int] = None,
+    ingest_engine: IngestEngine = "sqlalchemy",
 ):
+    if ingest_engine == "parallel":
+        from .parallel import ingest_gtfs_csv_into_db_in_parallel
+
+        return ingest_gtfs_csv_into_db_in_parallel(
+            session, download, reader, batch_size
+        )
     feed_info = ingest_feed_info(session, download, reader)
     ingest_rows(
         session=session,
@@ -136,10 +429,8 @@ def ingest_gtfs_csv_into_db(
         feed_info=feed_info,
         rows=reader.read_calendar(),
         batch_size=batch_size,
-        transforms={
-            "start_date": date_from_string,
-            "end_date": date_from_string,
-        },
+        ingest_engine=ingest_engine,
+        transforms=CALENDAR_TRANSFORMS,
     )
     ingest_rows(
         session=session,
@@ -147,9 +438,8 @@ def ingest_gtfs_csv_into_db(
         feed_info=feed_info,
         rows=reader.read_calendar_dates(),
         batch_size=batch_size,
-        transforms={
-            "date": date_from_string,
-        },
+        ingest_engine=ingest_engine,
+        transforms=CALENDAR_DATES_TRANSFORMS,
     )
     ingest_rows(
         session=session,
@@ -157,10 +447,8 @@ def ingest_gtfs_csv_into_db(
         feed_info=feed_info,
         rows=reader.read_calendar_attributes(),
         batch_size=batch_size,
-        transforms={
-            "rating_start_date": nullable(date_from_string),
-            "rating_end_date": nullable(date_from_string),
-        },
+        ingest_engine=ingest_engine,
+        transforms=CALENDAR_ATTRIBUTES_TRANSFORMS,
     )
     ingest_rows(
         session=session,
@@ -168,6 +456,7 @@ def ingest_gtfs_csv_into_db(
         feed_info=feed_info,
         rows=reader.read_lines(),
         batch_size=batch_size,
+        ingest_engine=ingest_engine,
     )
     ingest_rows(
         session=session,
@@ -175,6 +464,7 @@ def ingest_gtfs_csv_into_db(
         feed_info=feed_info,
         rows=reader.read_routes(),
         batch_size=batch_size,
+        ingest_engine=ingest_engine,
     )
     ingest_rows(
         session=session,
@@ -182,6 +472,7 @@ def ingest_gtfs_csv_into_db(
         feed_info=feed_info,
         rows=reader.read_route_patterns(),
         batch_size=batch_size,
+        ingest_engine=ingest_engine,
     )
     ingest_rows(
         session=session,
@@ -189,12 +480,8 @@ def ingest_gtfs_csv_into_db(
         feed_info=feed_info,
         rows=reader.read_shapes(),
         batch_size=batch_size,
-        transforms={
-            "shape_pt_lat": float,
-            "shape_pt_lon": float,
-            "shape_pt_sequence": int,
-            "shape_dist_traveled": nullable(float),
-        },
+        ingest_engine=ingest_engine,
+        transforms=SHAPES_TRANSFORMS,
     )
     ingest_rows(
         session=session,
@@ -202,10 +489,8 @@ def ingest_gtfs_csv_into_db(
         feed_info=feed_info,
         rows=reader.read_stops(),
         batch_size=batch_size,
-        transforms={
-            "stop_lat": nullable(float),
-            "stop_lon": nullable(float),
-        },
+        ingest_engine=ingest_engine,
+        transforms=STOPS_TRANSFORMS,
     )
     ingest_rows(
         session=session,
@@ -213,34 +498,30 @@ def ingest_gtfs_csv_into_db(
         feed_info=feed_info,
         rows=reader.read_transfers(),
         batch_size=batch_size,
-        transforms={
-            "min_transfer_time": nullable(int),
-            "min_walk_time": nullable(int),
-            "min_wheelchair_time": nullable(int),
-            "suggested_buffer_time": nullable(int),
-        },
+        ingest_engine=ingest_engine,
+        transforms=TRANSFERS_TRANSFORMS,
     )
+    trip_summaries: TripStopTimesSummaries = {}
     ingest_rows(
         session=session,
-        model=Trip,
+        model=StopTime,
         feed_info=feed_info,
-        rows=get_augmented_trip_rows(reader),
+        rows=summarize_stop_time_rows(reader.read_stop_times(), trip_summaries),
         batch_size=batch_size,
-        transforms={
-            "start_time": seconds_from_string,
-            "end_time": seconds_from_string,
-        },
+        ingest_engine=ingest_engine,
+        transforms=STOP_TIMES_TRANSFORMS,
     )
     ingest_rows(
         session=session,
-        model=StopTime,
+        model=Trip,
         feed_info=feed_info,
-        rows=reader.read_stop_times(),
+        rows=get_trip_rows_with_extra_time_fields(reader.read_trips(), trip_summaries),
         batch_size=batch_size,
-        transforms={
-            "arrival_time": seconds_from_string,
-            "departure_time": seconds_from_string,
-            "stop_sequence": int,
-        },
+        ingest_engine=ingest_engine,
+        transforms=TRIPS_TRANSFORMS,
     )
+    ingest_shapes(session, feed_info, batch_size, ingest_engine)
+    ingest_service_dates(session, feed_info, batch_size, ingest_engine)
+    ingest_feed_file_digests(session, feed_info, reader, batch_size, ingest_engine)
+    build_spatial_indexes(session)
     session.commit()
@@ -0,0 +1,162 @@
+import sqlite3
+from typing import Dict, List, Tuple, Type
+
+from sqlalchemy import Table
+from sqlalchemy.dialects import sqlite
+
+from .models.base import Base
+from .models.shapes import ShapePoint
+from .models.stop_times import StopTime
+from .models.trips import Trip
+from .utils.sqlite import connect_read_only
+
+# Each of these ids is stored once in its own dimension table, and the tables
+# below refer to it by an integer key instead of repeating the string
+INTERNED_ID_TABLES: Dict[str, str] = {
+    "trip_id": "InternedTripId",
+    "stop_id": "InternedStopId",
+    "route_id": "InternedRouteId",
+    "service_id": "InternedServiceId",
+    "shape_id": "InternedShapeId",
+}
+INTERNED_MODELS: Tuple[Type[Base], ...] = (StopTime, ShapePoint, Trip)
+
+
+def get_key_column_name(id_column_name: str) -> str:
+    return id_column_name.replace("_id", "_key")
+
+
+def get_data_table_name(table: Table) -> str:
+    # The table that holds the rows, behind a view with the original name
+    return f"{table.name}Data"
+
+
+def get_interned_columns(table: Table) -> List[str]:
+    return [
+        column.name for column in table.columns if column.name in INTERNED_ID_TABLES
+    ]
+
+
+def is_db_interned(db_path: str) -> bool:
+    connection = connect_read_only(db_path)
+    try:
+        row = connection.execute(
+            "SELECT type FROM sqlite_master WHERE name = ?",
+            (StopTime.__tablename__,),
+        ).fetchone()
+    finally:
+        connection.close()
+    return row is not None and row[0] == "view"
+
+
+def create_interned_id_tables(connection: sqlite3.Connection):
+    for id_column_name, dimension_table in INTERNED_ID_TABLES.items():
+        connection.execute(
+            f'CREATE TABLE "{dimension_table}" '
+            "(key INTEGER PRIMARY KEY, value VARCHAR NOT NULL UNIQUE)"
+        )
+        # The ids from every model are gathered in one query, so that keys are
+        # handed out in sorted order and sort the same way as the ids they
+        # stand for
+        selects = [
+            f"SELECT DISTINCT {id_column_name} AS value "
+            f'FROM "{model.__tablename__}" WHERE {id_column_name} IS NOT NULL'
+            for model in INTERNED_MODELS
+            if id_column_name in model.__table__.columns
+        ]
+        connection.execute(
+            f'INSERT INTO "{dimension_table}" (value) '
+            f"{' UNION '.join(selects)} ORDER BY value"
+        )
+
+
+def get_data_table_ddl(table: Table) -> str:
+    dialect = sqlite.dialect()
+    columns = []
+    for column in table.columns:
+        if column.name in INTERNED_ID_TABLES:
+            columns.append(f"{get_key_column_name(column.name)} INTEGER")
+        elif column.primary_key:
+            columns.append(f"{column.name} INTEGER PRIMARY KEY")
+        else:
+            columns.append(f"{column.name} {column.type.compile(dialect=dialect)}")
+    return f'CREATE TABLE "{get_data_table_name(table)}" ({", ".join(columns)})'
+
+
+def get_joins(table_alias: str, interned_columns: List[str], key_first: bool) -> str:
+    joins = []
+    for index, id_column_name in enumerate(interned_columns):
+        dimension_alias = f"d{index}"
+        key_column_name = get_key_column_name(id_column_name)
+        condition = (
+            f"{dimension_alias}.key = {table_alias}.{key_column_name}"
+            if key_first
+            else f"{dimension_alias}.value = {table_alias}.{id_column_name}"
+        )
+        joins.append(
+            f'LEFT JOIN "{INTERNED_ID_TABLES[id_column_name]}" {dimension_alias} '
+            f"ON {condition}"
+        )
+    return " ".join(joins)
+
+
+def intern_table(connection: sqlite3.Connection, table: Table):
+    interned_columns = get_interned_columns(table)
+    data_table = get_data_table_name(table)
+    data_columns = []
+    source_columns = []
+    view_columns = []
+    for column in table.columns:
+        if column.name in interned_columns:
+            dimension_alias = f"d{interned_columns.index(column.name)}"
+            data_columns.append(get_key_column_name(column.name))
+            source_columns.append(f"{dimension_alias}.key")
+            view_columns.append(f"{dimension_alias}.value AS {column.name}")
+        else:
+            data_columns.append(column.name)
+            source_columns.append(f"f.{column.name}")
+            view_columns.append(f"f.{column.name}")
+    connection.execute(get_data_table_ddl(table))
+    connection.execute(
+        f'INSERT INTO "{data_table}" ({", ".join(data_columns)}) '
+        f'SELECT {", ".join(source_columns)} FROM "{table.name}" f '
+        f"{get_joins('f', interned_columns, key_first=False)} ORDER BY f.id"
+    )
+    connection.execute(f'DROP TABLE "{table.name}"')
+    connection.execute(
+        f'CREATE VIEW "{table.name}" AS SELECT {", ".join(view_columns)} '
+        f'FROM "{data_table}" f {get_joins("f", interned_columns, key_first=True)}'
+    )
+    # The model's indexes are recreated over the keys, under the same names
+    for index in table.indexes:
+        index_columns = [
+            (
+                get_key_column_name(column.name)
+                if column.name in interned_columns
+                else column.name
+            )
+            for column in index.columns
+        ]
+        connection.execute(
+            f'CREATE INDEX "{index.name}" ON "{data_table}" ({", ".join(index_columns)})'
+        )
+
+
+def intern_feed_ids(db_path: str):
+    # Rewrites a finished db so that StopTime, ShapePoint and Trip store integer
+    # keys instead of string ids. Views with the original table names put the
+    # ids back, so the models can still be used to read (but not write) them.
+    connection = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        connection.execute("BEGIN")
+        create_interned_id_tables(connection)
+        for model in INTERNED_MODELS:
+            intern_table(connection, model.__table__)
+        connection.execute("COMMIT")
+        connection.execute("VACUUM")
+    except Exception as ex:
+        if connection.in_transaction:
+            connection.execute("ROLLBACK")
+        raise ex
+    finally:
+        connection.close()
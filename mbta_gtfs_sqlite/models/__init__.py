@@ -2,10 +2,13 @@ from .base import *
 from .calendar import *
 from .calendar_attributes import *
 from .calendar_dates import *
+from .daily_trips import *
+from .digests import *
 from .feed_info import *
 from .lines import *
 from .route_patterns import *
 from .routes import *
+from .service_dates import *
 from .shapes import *
 from .stop_times import *
 from .stops import *
@@ -0,0 +1,25 @@
+import datetime
+
+from sqlalchemy import Index
+from sqlalchemy.types import Date, Integer, String
+from sqlalchemy.orm import mapped_column, Mapped
+
+from .base import Base
+
+
+class DailyTrip(Base):
+    # Not part of GTFS: one row for every date that each trip runs on, which is
+    # only filled in the compact db. It answers "which trips ran on route R on
+    # date D" with a single range scan over its index.
+    __table_args__ = (
+        Index("ix_DailyTrip_date_route_direction", "date", "route_id", "direction_id"),
+    )
+
+    date: Mapped[datetime.date] = mapped_column(Date)
+    route_id: Mapped[str] = mapped_column(String)
+    direction_id: Mapped[str] = mapped_column(String)
+    trip_id: Mapped[str] = mapped_column(String)
+    service_id: Mapped[str] = mapped_column(String)
+    start_time: Mapped[int] = mapped_column(Integer)
+    end_time: Mapped[int] = mapped_column(Integer)
+    stop_count: Mapped[int] = mapped_column(Integer)
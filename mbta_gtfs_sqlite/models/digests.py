@@ -0,0 +1,30 @@
+from typing import Literal
+
+from sqlalchemy import Index
+from sqlalchemy.types import Integer, LargeBinary, String
+from sqlalchemy.orm import mapped_column, Mapped
+
+from .base import Base
+
+EntityDigestType = Literal["trip", "shape", "route_pattern"]
+
+
+class FeedFileDigest(Base):
+    # Not part of GTFS: the sha256 of each file in the feed as it was ingested,
+    # and the number of rows in it
+    file_name: Mapped[str] = mapped_column(String, index=True)
+    sha256: Mapped[str] = mapped_column(String)
+    row_count: Mapped[int] = mapped_column(Integer)
+
+
+class EntityDigest(Base):
+    # Not part of GTFS: a hash of the contents of each trip (with its stop times),
+    # shape, and route pattern (with the stops of its representative trip), which
+    # can be compared with those of other feeds
+    __table_args__ = (
+        Index("ix_EntityDigest_entity_type_entity_id", "entity_type", "entity_id"),
+    )
+
+    entity_type: Mapped[EntityDigestType] = mapped_column(String)
+    entity_id: Mapped[str] = mapped_column(String)
+    digest: Mapped[bytes] = mapped_column(LargeBinary)
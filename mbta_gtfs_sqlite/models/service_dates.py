@@ -0,0 +1,19 @@
+import datetime
+
+from sqlalchemy import Index
+from sqlalchemy.types import Date, String
+from sqlalchemy.orm import mapped_column, Mapped
+
+from .base import Base
+
+
+class ServiceDate(Base):
+    # Not part of GTFS: every date on which each service runs, with the feed's
+    # calendar exceptions already applied
+    __table_args__ = (
+        # The services active on a date, without reading the table
+        Index("ix_ServiceDate_date_service_id", "date", "service_id"),
+    )
+
+    service_id: Mapped[str] = mapped_column(String, index=True)
+    date: Mapped[datetime.date] = mapped_column(Date)
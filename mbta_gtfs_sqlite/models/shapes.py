@@ -1,3 +1,4 @@
+from sqlalchemy import Index
 from sqlalchemy.types import String, Integer, Float
 from sqlalchemy.orm import mapped_column, Mapped
 
@@ -5,8 +6,24 @@ from .base import Base
 
 
 class ShapePoint(Base):
-    shape_id: Mapped[str] = mapped_column(String, index=True)
+    __table_args__ = (
+        Index(
+            "ix_ShapePoint_shape_id_shape_pt_sequence", "shape_id", "shape_pt_sequence"
+        ),
+    )
+
+    shape_id: Mapped[str] = mapped_column(String)
     shape_pt_lat: Mapped[float] = mapped_column(Float)
     shape_pt_lon: Mapped[float] = mapped_column(Float)
     shape_pt_sequence: Mapped[int] = mapped_column(Integer)
     shape_dist_traveled: Mapped[float] = mapped_column(Float, nullable=True)
+
+
+class Shape(Base):
+    # Not part of GTFS: every point of a shape in a single encoded polyline (see
+    # utils/polyline.py), which may have been simplified to within tolerance
+    # meters of the original
+    shape_id: Mapped[str] = mapped_column(String, index=True)
+    polyline: Mapped[str] = mapped_column(String)
+    point_count: Mapped[int] = mapped_column(Integer)
+    tolerance: Mapped[float] = mapped_column(Float)
@@ -1,3 +1,4 @@
+from sqlalchemy import Index
 from sqlalchemy.types import String, Integer
 from sqlalchemy.orm import mapped_column, Mapped
 
@@ -5,8 +6,20 @@ from .base import Base
 
 
 class StopTime(Base):
-    trip_id: Mapped[str] = mapped_column(String, index=True)
-    stop_id: Mapped[str] = mapped_column(String, index=True)
+    __table_args__ = (
+        # A trip's stop times in order
+        Index("ix_StopTime_trip_id_stop_sequence", "trip_id", "stop_sequence"),
+        # Departures from a stop within a time range, without reading the table
+        Index(
+            "ix_StopTime_stop_id_departure_time",
+            "stop_id",
+            "departure_time",
+            "trip_id",
+        ),
+    )
+
+    trip_id: Mapped[str] = mapped_column(String)
+    stop_id: Mapped[str] = mapped_column(String)
     arrival_time: Mapped[int] = mapped_column(Integer)
     departure_time: Mapped[int] = mapped_column(Integer)
     stop_sequence: Mapped[int] = mapped_column(Integer)
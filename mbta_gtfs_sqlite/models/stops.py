@@ -42,7 +42,7 @@ TWheelchairBoardingType = Literal[
 
 
 class Stop(Base):
-    stop_id: Mapped[str] = mapped_column(String)
+    stop_id: Mapped[str] = mapped_column(String, index=True)
     stop_code: Mapped[str] = mapped_column(String)
     stop_name: Mapped[str] = mapped_column(String)
     stop_desc: Mapped[str] = mapped_column(String)
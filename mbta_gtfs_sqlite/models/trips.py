@@ -1,6 +1,7 @@
 from enum import Enum
 from typing import Literal
 
+from sqlalchemy import Index
 from sqlalchemy.types import String, Integer
 from sqlalchemy.orm import mapped_column, Mapped
 
@@ -38,9 +39,13 @@ TBikesAllowed = Literal[
 
 
 class Trip(Base):
-    route_id: Mapped[str] = mapped_column(String, index=True)
+    __table_args__ = (
+        Index("ix_Trip_route_id_direction_id", "route_id", "direction_id"),
+    )
+
+    route_id: Mapped[str] = mapped_column(String)
     service_id: Mapped[str] = mapped_column(String, index=True)
-    trip_id: Mapped[str] = mapped_column(String)
+    trip_id: Mapped[str] = mapped_column(String, index=True)
     trip_headsign: Mapped[str] = mapped_column(String)
     trip_short_name: Mapped[str] = mapped_column(String)
     direction_id: Mapped[str] = mapped_column(String)
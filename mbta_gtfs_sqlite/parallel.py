@@ -0,0 +1,211 @@
+from concurrent.futures import (
+    Executor,
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    as_completed,
+    wait,
+)
+from contextlib import contextmanager
+from dataclasses import dataclass
+from os import cpu_count, path
+from tempfile import TemporaryDirectory
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple, Type, Union
+
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.orm import Session
+
+from .build import GtfsFeedDownloadResult
+from .reader import GtfsReader, ZipGtfsReader
+from .spatial import build_spatial_indexes
+from .ingest import (
+    CALENDAR_ATTRIBUTES_TRANSFORMS,
+    CALENDAR_DATES_TRANSFORMS,
+    CALENDAR_TRANSFORMS,
+    SHAPES_TRANSFORMS,
+    STOP_TIMES_TRANSFORMS,
+    STOPS_TRANSFORMS,
+    TRANSFERS_TRANSFORMS,
+    TRIPS_TRANSFORMS,
+    CompiledRowInsert,
+    RowTransforms,
+    TripStopTimesSummaries,
+    compile_row_insert,
+    get_trip_rows_with_extra_time_fields,
+    ingest_feed_file_digests,
+    ingest_feed_info,
+    ingest_rows,
+    ingest_service_dates,
+    ingest_shapes,
+    summarize_stop_time_rows,
+)
+from .models.base import Base
+from .models.calendar_attributes import CalendarAttribute
+from .models.calendar_dates import CalendarServiceException
+from .models.calendar import CalendarService
+from .models.lines import Line
+from .models.route_patterns import RoutePattern
+from .models.routes import Route
+from .models.shapes import ShapePoint
+from .models.stops import Stop
+from .models.stop_times import StopTime
+from .models.transfers import Transfer
+from .models.trips import Trip
+
+DEFAULT_CHUNK_SIZE = 32 * 1024 * 1024
+
+# Every file except trips.txt, which needs a summary of all of stop_times.txt
+# before it can be ingested, and feed_info.txt, which is ingested up front
+PARALLEL_GTFS_FILES: Dict[str, Tuple[Type[Base], RowTransforms]] = {
+    "calendar": (CalendarService, CALENDAR_TRANSFORMS),
+    "calendar_dates": (CalendarServiceException, CALENDAR_DATES_TRANSFORMS),
+    "calendar_attributes": (CalendarAttribute, CALENDAR_ATTRIBUTES_TRANSFORMS),
+    "lines": (Line, {}),
+    "routes": (Route, {}),
+    "route_patterns": (RoutePattern, {}),
+    "shapes": (ShapePoint, SHAPES_TRANSFORMS),
+    "stops": (Stop, STOPS_TRANSFORMS),
+    "transfers": (Transfer, TRANSFERS_TRANSFORMS),
+    "stop_times": (StopTime, STOP_TIMES_TRANSFORMS),
+}
+
+# Large files are split into byte ranges that can be parsed independently
+CHUNKED_GTFS_FILES = ("shapes", "stop_times")
+
+
+@dataclass
+class GtfsFileTask(object):
+    reader: GtfsReader
+    file_name: str
+    feed_info_id: int
+    byte_range: Union[None, Tuple[int, int]] = None
+
+
+@dataclass
+class GtfsFileTaskResult(object):
+    file_name: str
+    rows: List[Tuple]
+    trip_summaries: TripStopTimesSummaries
+
+
+def compile_row_insert_for_file(file_name: str) -> CompiledRowInsert:
+    model, transforms = PARALLEL_GTFS_FILES[file_name]
+    return compile_row_insert(model, transforms, sqlite.dialect())
+
+
+def parse_gtfs_file_task(task: GtfsFileTask) -> GtfsFileTaskResult:
+    # This runs in a worker process, so everything it needs is rebuilt from the
+    # task rather than passed in
+    if task.byte_range:
+        rows = task.reader.read_byte_range(task.file_name, *task.byte_range)
+    else:
+        rows = task.reader.read_file(task.file_name)
+    trip_summaries = {}
+    if task.file_name == "stop_times":
+        rows = summarize_stop_time_rows(rows, trip_summaries)
+    compiled = compile_row_insert_for_file(task.file_name)
+    return GtfsFileTaskResult(
+        file_name=task.file_name,
+        rows=[compiled.row_to_tuple(row, task.feed_info_id) for row in rows],
+        trip_summaries=trip_summaries,
+    )
+
+
+def get_gtfs_file_tasks(
+    reader: GtfsReader,
+    feed_info_id: int,
+    chunk_size: int,
+    chunkable_reader: Union[None, GtfsReader] = None,
+) -> List[GtfsFileTask]:
+    chunkable_reader = chunkable_reader or reader
+    tasks = []
+    for file_name in PARALLEL_GTFS_FILES.keys():
+        if file_name in CHUNKED_GTFS_FILES:
+            for byte_range in chunkable_reader.get_byte_ranges(file_name, chunk_size):
+                tasks.append(
+                    GtfsFileTask(chunkable_reader, file_name, feed_info_id, byte_range)
+                )
+        else:
+            tasks.append(GtfsFileTask(reader, file_name, feed_info_id))
+    # Start the chunks of the large files first so they don't hold up the end
+    return sorted(tasks, key=lambda task: task.byte_range is None)
+
+
+@contextmanager
+def get_chunkable_reader(reader: GtfsReader) -> Iterator[GtfsReader]:
+    # Yields a reader that can read byte ranges of the large files cheaply. Those
+    # of a zip are extracted next to it for as long as the ingest runs.
+    if not isinstance(reader, ZipGtfsReader):
+        yield reader
+        return
+    with TemporaryDirectory(dir=path.dirname(path.abspath(reader.root))) as temp_dir:
+        yield reader.extract_files(CHUNKED_GTFS_FILES, temp_dir)
+
+
+def map_with_bounded_queue(
+    executor: Executor,
+    func: Callable,
+    items: Iterable,
+    max_pending: int,
+):
+    # Yields results in completion order, but never lets more than max_pending
+    # parsed results pile up waiting for the writer
+    pending = set()
+    for item in items:
+        pending.add(executor.submit(func, item))
+        if len(pending) >= max_pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    for future in as_completed(pending):
+        yield future.result()
+
+
+def ingest_gtfs_csv_into_db_in_parallel(
+    session: Session,
+    download: GtfsFeedDownloadResult,
+    reader: GtfsReader,
+    batch_size: Union[None, int] = None,
+    max_workers: Union[None, int] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+):
+    feed_info = ingest_feed_info(session, download, reader)
+    with get_chunkable_reader(reader) as chunkable_reader:
+        tasks = get_gtfs_file_tasks(reader, feed_info.id, chunk_size, chunkable_reader)
+        statements = {
+            file_name: compile_row_insert_for_file(file_name).statement
+            for file_name in PARALLEL_GTFS_FILES.keys()
+        }
+        trip_summaries: TripStopTimesSummaries = {}
+        # Worker processes parse and convert rows, and this thread is the only one
+        # that writes to the db
+        cursor = session.connection().connection.cursor()
+        try:
+            max_workers = max_workers or cpu_count() or 1
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                max_pending = 2 * max_workers
+                for result in map_with_bounded_queue(
+                    executor, parse_gtfs_file_task, tasks, max_pending
+                ):
+                    cursor.executemany(statements[result.file_name], result.rows)
+                    for trip_id, summary in result.trip_summaries.items():
+                        existing_summary = trip_summaries.get(trip_id)
+                        if existing_summary is None:
+                            trip_summaries[trip_id] = summary
+                        else:
+                            existing_summary.merge(summary)
+        finally:
+            cursor.close()
+    ingest_rows(
+        session=session,
+        model=Trip,
+        feed_info=feed_info,
+        rows=get_trip_rows_with_extra_time_fields(reader.read_trips(), trip_summaries),
+        batch_size=batch_size,
+        transforms=TRIPS_TRANSFORMS,
+        ingest_engine="executemany",
+    )
+    ingest_shapes(session, feed_info, batch_size, "executemany")
+    ingest_service_dates(session, feed_info, batch_size, "executemany")
+    ingest_feed_file_digests(session, feed_info, reader, batch_size, "executemany")
+    build_spatial_indexes(session)
+    session.commit()
@@ -0,0 +1,83 @@
+import re
+import sqlite3
+from typing import Dict, List, Set
+
+# The queries that the indexes on each model are meant to serve. None of them
+# should need to scan a whole table or sort rows in a temporary b-tree.
+HOT_QUERIES: Dict[str, str] = {
+    "stop times of a trip": (
+        'SELECT * FROM "StopTime" WHERE trip_id = :trip_id ORDER BY stop_sequence'
+    ),
+    "departures from a stop": (
+        'SELECT trip_id, departure_time FROM "StopTime" WHERE stop_id = :stop_id '
+        "AND departure_time BETWEEN :start_time AND :end_time "
+        "ORDER BY departure_time"
+    ),
+    "points of a shape": (
+        'SELECT * FROM "ShapePoint" WHERE shape_id = :shape_id '
+        "ORDER BY shape_pt_sequence"
+    ),
+    "shape by id": 'SELECT * FROM "Shape" WHERE shape_id = :shape_id',
+    "trip by id": 'SELECT * FROM "Trip" WHERE trip_id = :trip_id',
+    "trips on a route": (
+        'SELECT * FROM "Trip" WHERE route_id = :route_id '
+        "AND direction_id = :direction_id"
+    ),
+    "trips of a service": 'SELECT * FROM "Trip" WHERE service_id = :service_id',
+    "stop by id": 'SELECT * FROM "Stop" WHERE stop_id = :stop_id',
+    "route patterns of a route": (
+        'SELECT * FROM "RoutePattern" WHERE route_id = :route_id'
+    ),
+    "services on a date": 'SELECT service_id FROM "ServiceDate" WHERE date = :date',
+    "dates of a service": (
+        'SELECT date FROM "ServiceDate" WHERE service_id = :service_id'
+    ),
+    "trips on a route on a date": (
+        'SELECT * FROM "DailyTrip" WHERE date = :date AND route_id = :route_id '
+        "AND direction_id = :direction_id"
+    ),
+    "digest of an entity": (
+        'SELECT digest FROM "EntityDigest" WHERE entity_type = :entity_type '
+        "AND entity_id = :entity_id"
+    ),
+    "exceptions of a service": (
+        'SELECT * FROM "CalendarServiceException" WHERE service_id = :service_id'
+    ),
+}
+
+
+def get_query_plan(connection: sqlite3.Connection, query: str) -> List[str]:
+    # Parameters don't change the plan, so any value will do
+    parameters = {name: None for name in re.findall(r":(\w+)", query)}
+    rows = connection.execute(f"EXPLAIN QUERY PLAN {query}", parameters).fetchall()
+    return [row[-1] for row in rows]
+
+
+# Tables small enough that reading all of their rows is fine
+SCANNABLE_TABLES: Set[str] = {"FeedInfo"}
+
+
+def is_slow_plan_step(step: str) -> bool:
+    # A SCAN reads every row of the table, even when it reads them from a
+    # covering index, so only SEARCHes are fast
+    if step.startswith("SCAN "):
+        table_name = step.split(" ")[1]
+        return table_name not in SCANNABLE_TABLES
+    return step.startswith("USE TEMP B-TREE")
+
+
+def find_slow_query_plans(
+    connection: sqlite3.Connection,
+    queries: Dict[str, str] = HOT_QUERIES,
+) -> Dict[str, List[str]]:
+    # Returns the slow steps of the plan of every query that has any
+    slow_plans = {}
+    for name, query in queries.items():
+        slow_steps = [
+            step
+            for step in get_query_plan(connection, query)
+            if is_slow_plan_step(step)
+        ]
+        if slow_steps:
+            slow_plans[name] = slow_steps
+    return slow_plans
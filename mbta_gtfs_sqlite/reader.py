@@ -1,15 +1,28 @@
-from csv import DictReader
+import hashlib
+from csv import DictReader, reader
+from io import TextIOWrapper
 from os import path
+from shutil import copyfileobj
+from typing import BinaryIO, Iterable, List, Tuple, Union
+from zipfile import ZipFile
+
+
+DIGEST_CHUNK_SIZE = 1024 * 1024
 
 
 class GtfsReader:
-    def _reader_by_file_name(self, name: str):
-        file_path = path.join(self.root, name + ".txt")
+    def _open(self, name: str) -> BinaryIO:
+        return open(path.join(self.root, name + ".txt"), "rb")
 
+    def _file_size(self, name: str) -> int:
+        return path.getsize(path.join(self.root, name + ".txt"))
+
+    def _reader_by_file_name(self, name: str):
         def load():
             try:
-                with open(file_path, "r") as file:
-                    dict_reader = DictReader(file)
+                with self._open(name) as file:
+                    text_file = TextIOWrapper(file, encoding="utf-8-sig", newline="")
+                    dict_reader = DictReader(text_file)
                     for row in dict_reader:
                         yield row
             except FileNotFoundError:
@@ -17,6 +30,67 @@ class GtfsReader:
 
         return load
 
+    def read_file(self, name: str):
+        return self._reader_by_file_name(name)()
+
+    def get_byte_ranges(self, name: str, chunk_size: int) -> List[Tuple[int, int]]:
+        try:
+            with self._open(name) as file:
+                header_size = len(file.readline())
+        except FileNotFoundError:
+            return []
+        size = self._file_size(name)
+        return [
+            (start, min(start + chunk_size, size))
+            for start in range(header_size, size, chunk_size)
+        ]
+
+    def read_byte_range(self, name: str, start: int, end: int):
+        # Reads every row that starts within [start, end) of the file, so that
+        # the ranges from get_byte_ranges cover each row exactly once. Rows are
+        # assumed not to contain quoted line breaks.
+        with self._open(name) as file:
+            header = file.readline().decode("utf-8-sig")
+            field_names = next(reader([header]))
+            if start > file.tell():
+                file.seek(start - 1)
+                file.readline()
+            position = file.tell()
+
+            def lines():
+                nonlocal position
+                while position < end:
+                    line = file.readline()
+                    if not line:
+                        return
+                    position += len(line)
+                    yield line.decode("utf-8")
+
+            yield from DictReader(lines(), fieldnames=field_names)
+
+    def get_file_digest(self, name: str) -> Union[None, Tuple[str, int]]:
+        # The sha256 of a file's bytes, and the number of rows after its header.
+        # Like read_byte_range, this assumes rows don't contain quoted line breaks.
+        digest = hashlib.sha256()
+        line_count = 0
+        last_byte = b"\n"
+        try:
+            with self._open(name) as file:
+                for chunk in iter(lambda: file.read(DIGEST_CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    line_count += chunk.count(b"\n")
+                    last_byte = chunk[-1:]
+        except FileNotFoundError:
+            return None
+        if last_byte != b"\n":
+            line_count += 1
+        return digest.hexdigest(), max(0, line_count - 1)
+
+    def __reduce__(self):
+        # The read_* attributes are closures, so rebuild readers from their root
+        # when they're sent to another process
+        return (self.__class__, (self.root,))
+
     def __init__(self, root: str):
         self.root = root
         self.read_calendar = self._reader_by_file_name("calendar")
@@ -31,3 +105,54 @@ class GtfsReader:
         self.read_stops = self._reader_by_file_name("stops")
         self.read_transfers = self._reader_by_file_name("transfers")
         self.read_trips = self._reader_by_file_name("trips")
+
+
+class ZipGtfsReader(GtfsReader):
+    # Reads a GTFS bundle straight out of its zip file, whose root is the path to
+    # the zip. Bundles that keep their files in a single top-level directory
+    # are read from inside that directory.
+    def _member_name(self, name: str) -> str:
+        return self.member_prefix + name + ".txt"
+
+    def _open(self, name: str) -> BinaryIO:
+        # The opened member keeps the underlying file open after the ZipFile
+        # itself is closed
+        with ZipFile(self.root) as zip_file:
+            try:
+                return zip_file.open(self._member_name(name))
+            except KeyError:
+                raise FileNotFoundError(name)
+
+    def _file_size(self, name: str) -> int:
+        with ZipFile(self.root) as zip_file:
+            return zip_file.getinfo(self._member_name(name)).file_size
+
+    def extract_files(self, names: Iterable[str], target_dir: str) -> GtfsReader:
+        # Seeking within a deflated member inflates everything before the new
+        # position, so reading many byte ranges of a large member gets slower
+        # with every range. Extracting it once lets them be read from disk.
+        for name in names:
+            try:
+                with self._open(name) as source:
+                    target_path = path.join(target_dir, name + ".txt")
+                    with open(target_path, "wb") as target:
+                        copyfileobj(source, target, DIGEST_CHUNK_SIZE)
+            except FileNotFoundError:
+                pass
+        return GtfsReader(target_dir)
+
+    def __init__(self, root: str):
+        with ZipFile(root) as zip_file:
+            names = zip_file.namelist()
+        top_level_names = set(name.split("/")[0] for name in names)
+        if len(top_level_names) == 1 and any("/" in name for name in names):
+            self.member_prefix = top_level_names.pop() + "/"
+        else:
+            self.member_prefix = ""
+        super().__init__(root)
+
+
+def create_gtfs_reader(feed_path: str) -> GtfsReader:
+    if path.isdir(feed_path):
+        return GtfsReader(feed_path)
+    return ZipGtfsReader(feed_path)
@@ -0,0 +1,148 @@
+from datetime import date, timedelta
+from typing import Dict, FrozenSet, Iterable, List, Tuple, Union
+
+from sqlalchemy.orm import Session
+
+from .models.calendar import CalendarService, ServiceDayAvailability
+from .models.calendar_dates import (
+    CalendarServiceException,
+    CalendarServiceExceptionType,
+)
+from .models.service_dates import ServiceDate
+
+WEEKDAY_COLUMNS = (
+    "monday",
+    "tuesday",
+    "wednesday",
+    "thursday",
+    "friday",
+    "saturday",
+    "sunday",
+)
+
+
+class ServiceCalendar(object):
+    # Resolves the dates on which each service runs. Every service gets a bitset
+    # with one bit per day of the calendar, starting from start_date, and every
+    # day gets the set of services that run on it.
+    def __init__(
+        self,
+        services: Iterable[CalendarService],
+        exceptions: Iterable[CalendarServiceException],
+    ):
+        services = list(services)
+        exceptions = list(exceptions)
+        dates = [
+            *(service.start_date for service in services),
+            *(service.end_date for service in services),
+            *(exception.date for exception in exceptions),
+        ]
+        self.start_date: Union[None, date] = min(dates) if dates else None
+        self.end_date: Union[None, date] = max(dates) if dates else None
+        self._bitsets: Dict[str, int] = {}
+        for service in services:
+            self._bitsets[service.service_id] = self._get_weekly_bitset(service)
+        for exception in exceptions:
+            bit = 1 << self._get_offset(exception.date)
+            bitset = self._bitsets.get(exception.service_id, 0)
+            if exception.exception_type == CalendarServiceExceptionType.ADDED:
+                bitset |= bit
+            else:
+                bitset &= ~bit
+            self._bitsets[exception.service_id] = bitset
+        self._build_services_by_day()
+
+    def _get_offset(self, target_date: date) -> int:
+        return (target_date - self.start_date).days
+
+    def _get_weekly_bitset(self, service: CalendarService) -> int:
+        runs_on_weekday = [
+            getattr(service, column) == ServiceDayAvailability.AVAILABLE
+            for column in WEEKDAY_COLUMNS
+        ]
+        bitset = 0
+        day = service.start_date
+        while day <= service.end_date:
+            if runs_on_weekday[day.weekday()]:
+                bitset |= 1 << self._get_offset(day)
+            day += timedelta(days=1)
+        return bitset
+
+    def _build_services_by_day(self):
+        day_count = 0 if self.start_date is None else self._get_offset(self.end_date)
+        services_by_day: List[List[str]] = [[] for _ in range(day_count + 1)]
+        for service_id, bitset in self._bitsets.items():
+            for offset in iterate_set_bits(bitset):
+                services_by_day[offset].append(service_id)
+        self._services_by_day: List[FrozenSet[str]] = [
+            frozenset(service_ids) for service_ids in services_by_day
+        ]
+
+    def _is_in_range(self, target_date: date) -> bool:
+        return (
+            self.start_date is not None
+            and self.start_date <= target_date <= self.end_date
+        )
+
+    @property
+    def service_ids(self) -> List[str]:
+        return list(self._bitsets.keys())
+
+    def get_active_service_ids(self, target_date: date) -> FrozenSet[str]:
+        if not self._is_in_range(target_date):
+            return frozenset()
+        return self._services_by_day[self._get_offset(target_date)]
+
+    def is_service_active(self, service_id: str, target_date: date) -> bool:
+        if not self._is_in_range(target_date):
+            return False
+        return bool(
+            self._bitsets.get(service_id, 0) >> self._get_offset(target_date) & 1
+        )
+
+    def get_service_dates(self, service_id: str) -> List[date]:
+        return [
+            self.start_date + timedelta(days=offset)
+            for offset in iterate_set_bits(self._bitsets.get(service_id, 0))
+        ]
+
+    def iterate_service_dates(self) -> Iterable[Tuple[str, date]]:
+        for service_id in self._bitsets.keys():
+            for service_date in self.get_service_dates(service_id):
+                yield service_id, service_date
+
+
+def iterate_set_bits(bitset: int) -> Iterable[int]:
+    while bitset:
+        lowest_bit = bitset & -bitset
+        yield lowest_bit.bit_length() - 1
+        bitset ^= lowest_bit
+
+
+def create_service_calendar(
+    session: Session,
+    feed_info_id: Union[None, int] = None,
+) -> ServiceCalendar:
+    services = session.query(CalendarService)
+    exceptions = session.query(CalendarServiceException)
+    if feed_info_id is not None:
+        services = services.filter(CalendarService.feed_info_id == feed_info_id)
+        exceptions = exceptions.filter(
+            CalendarServiceException.feed_info_id == feed_info_id
+        )
+    return ServiceCalendar(services.all(), exceptions.all())
+
+
+def get_service_date_rows(calendar: ServiceCalendar) -> Iterable[Dict[str, date]]:
+    for service_id, service_date in calendar.iterate_service_dates():
+        yield {"service_id": service_id, "date": service_date}
+
+
+def get_active_service_ids_from_db(session: Session, target_date: date) -> List[str]:
+    # Reads from the materialized ServiceDate table, without building a calendar
+    return [
+        service_id
+        for (service_id,) in session.query(ServiceDate.service_id).filter(
+            ServiceDate.date == target_date
+        )
+    ]
@@ -1,10 +1,170 @@
-from sqlalchemy import create_engine
+import sqlite3
+from os import fsync, path
+from threading import Lock
+from typing import Any, Dict, Tuple, Union
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import QueuePool, StaticPool
+from sqlalchemy.schema import CreateTable
 
+from .compression import COMPRESSED_SUFFIX
 from .models.base import Base
+from .utils.sqlite import get_read_only_uri
+
+# These trade away crash safety for speed, which is fine while building a db
+# from scratch: if the build fails, the file is thrown away anyway
+BULK_BUILD_PRAGMAS = (
+    "PRAGMA journal_mode = OFF",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA cache_size = -262144",
+    "PRAGMA temp_store = MEMORY",
+)
+
+
+# Lets every process serving the same db read it straight out of the OS page
+# cache, rather than each keeping its own copy of hot pages
+SERVING_MMAP_SIZE = 1024 * 1024 * 1024
+
+# Engines shared by every session opened on the same file in the same mode
+_engines: Dict[Tuple[str, bool, bool], Engine] = {}
+_engines_lock = Lock()
+
+
+def set_bulk_build_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in BULK_BUILD_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+
+def set_read_only_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only = ON")
+    cursor.close()
+
+
+def set_serving_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only = ON")
+    cursor.execute(f"PRAGMA mmap_size = {SERVING_MMAP_SIZE}")
+    cursor.close()
+
 
+def create_tables_without_indexes(engine: Engine):
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            connection.execute(CreateTable(table))
 
-def create_sqlalchemy_session(file_path: str) -> Session:
-    engine = create_engine(f"sqlite:///{file_path}")
-    Base.metadata.create_all(bind=engine)
+
+def create_indexes(engine: Engine):
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+
+def create_sqlite_engine(
+    file_path: str,
+    bulk_build: bool = False,
+    read_only: bool = False,
+    serving: bool = False,
+    engine_options: Union[None, Dict[str, Any]] = None,
+) -> Engine:
+    engine_options = engine_options or {}
+    if file_path.endswith(COMPRESSED_SUFFIX):
+        # A compressed db is decompressed into a single in-memory connection
+        # that every session on the engine shares, and is always read-only
+        from .compression import connect_compressed_db
+
+        connection = connect_compressed_db(file_path)
+        return create_engine(
+            "sqlite://",
+            creator=lambda: connection,
+            **{"poolclass": StaticPool, **engine_options},
+        )
+    if read_only or serving:
+        # A read-only db is opened as-is: nothing is created, and sqlite refuses
+        # any writes. A db opened for serving is also marked immutable, which
+        # skips locking entirely, so it must never change while it's open.
+        uri = get_read_only_uri(file_path)
+        if serving:
+            uri += "&immutable=1"
+        engine = create_engine(
+            "sqlite://",
+            creator=lambda: sqlite3.connect(uri, uri=True, check_same_thread=False),
+            **{"poolclass": QueuePool, **engine_options},
+        )
+        pragmas = set_serving_pragmas if serving else set_read_only_pragmas
+        event.listen(engine, "connect", pragmas)
+        return engine
+    engine = create_engine(f"sqlite:///{file_path}", **engine_options)
+    if bulk_build:
+        event.listen(engine, "connect", set_bulk_build_pragmas)
+        create_tables_without_indexes(engine)
+    else:
+        Base.metadata.create_all(bind=engine)
+    return engine
+
+
+def get_cached_sqlite_engine(
+    file_path: str,
+    read_only: bool = False,
+    serving: bool = False,
+    engine_options: Union[None, Dict[str, Any]] = None,
+) -> Engine:
+    # engine_options only apply to the first call for a given file and mode
+    key = (path.abspath(file_path), read_only, serving)
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = create_sqlite_engine(
+                file_path,
+                read_only=read_only,
+                serving=serving,
+                engine_options=engine_options,
+            )
+            _engines[key] = engine
+        return engine
+
+
+def dispose_sqlite_engines(file_path: Union[None, str] = None):
+    absolute_path = path.abspath(file_path) if file_path else None
+    with _engines_lock:
+        for key in list(_engines.keys()):
+            if absolute_path is None or key[0] == absolute_path:
+                _engines.pop(key).dispose()
+
+
+def create_sqlalchemy_session(
+    file_path: str,
+    bulk_build: bool = False,
+    read_only: bool = False,
+    serving: bool = False,
+    reuse_engine: bool = False,
+    engine_options: Union[None, Dict[str, Any]] = None,
+) -> Session:
+    if reuse_engine and not bulk_build:
+        engine = get_cached_sqlite_engine(file_path, read_only, serving, engine_options)
+    else:
+        engine = create_sqlite_engine(
+            file_path,
+            bulk_build=bulk_build,
+            read_only=read_only,
+            serving=serving,
+            engine_options=engine_options,
+        )
     return sessionmaker(bind=engine)()
+
+
+def finish_bulk_build(session: Session):
+    session.commit()
+    engine = session.get_bind()
+    create_indexes(engine)
+    session.close()
+    # The build pragmas only live as long as the connections that set them, so
+    # once these are closed the file is a normal sqlite db again
+    engine.dispose()
+    with open(engine.url.database, "rb+") as file:
+        fsync(file.fileno())
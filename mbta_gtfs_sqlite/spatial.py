@@ -0,0 +1,222 @@
+from dataclasses import dataclass
+from math import cos, radians
+from typing import Any, Dict, Iterable, List, Tuple, Union
+
+from more_itertools import chunked
+from sqlalchemy import Integer, text
+from sqlalchemy.orm import Session
+
+from .models.shapes import Shape
+from .models.stops import Stop
+from .utils.polyline import METERS_PER_DEGREE, decode_polyline
+
+# R*Tree virtual tables, which sqlite keeps alongside the regular tables. Their
+# boxes are stored as float32 but always rounded outwards, so a search never
+# misses anything, and exact distances are worked out afterwards.
+STOP_INDEX_TABLE = "StopSpatialIndex"
+SHAPE_SEGMENT_INDEX_TABLE = "ShapeSegmentSpatialIndex"
+SHAPE_SEGMENT_BATCH_SIZE = 10000
+
+# Searches for the nearest thing start this far out and double until they find it
+INITIAL_SEARCH_RADIUS = 250
+MAX_SEARCH_RADIUS = 64000
+
+
+@dataclass
+class ShapeSnap(object):
+    shape_id: str
+    # The segment between the shape's points at segment_index and segment_index + 1
+    segment_index: int
+    lat: float
+    lon: float
+    distance: float
+
+
+def create_spatial_indexes(session: Session):
+    session.execute(
+        text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {STOP_INDEX_TABLE} "
+            "USING rtree(id, min_lat, max_lat, min_lon, max_lon)"
+        )
+    )
+    session.execute(
+        text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SHAPE_SEGMENT_INDEX_TABLE} "
+            "USING rtree(id, min_lat, max_lat, min_lon, max_lon, +shape_id, "
+            "+segment_index, +start_lat, +start_lon, +end_lat, +end_lon)"
+        )
+    )
+
+
+def get_shape_segment_rows(session: Session) -> Iterable[Dict[str, Any]]:
+    for shape_id, polyline in session.query(Shape.shape_id, Shape.polyline):
+        points = decode_polyline(polyline)
+        for index, (start, end) in enumerate(zip(points, points[1:])):
+            yield {
+                "min_lat": min(start[0], end[0]),
+                "max_lat": max(start[0], end[0]),
+                "min_lon": min(start[1], end[1]),
+                "max_lon": max(start[1], end[1]),
+                "shape_id": shape_id,
+                "segment_index": index,
+                "start_lat": start[0],
+                "start_lon": start[1],
+                "end_lat": end[0],
+                "end_lon": end[1],
+            }
+
+
+def build_spatial_indexes(session: Session):
+    # Indexes every Stop with a location, and every segment of every Shape
+    create_spatial_indexes(session)
+    session.execute(text(f"DELETE FROM {STOP_INDEX_TABLE}"))
+    session.execute(
+        text(
+            f"INSERT INTO {STOP_INDEX_TABLE} "
+            "SELECT id, stop_lat, stop_lat, stop_lon, stop_lon FROM Stop "
+            "WHERE stop_lat IS NOT NULL AND stop_lon IS NOT NULL"
+        )
+    )
+    session.execute(text(f"DELETE FROM {SHAPE_SEGMENT_INDEX_TABLE}"))
+    insert_segment = text(
+        f"INSERT INTO {SHAPE_SEGMENT_INDEX_TABLE} "
+        "(min_lat, max_lat, min_lon, max_lon, shape_id, segment_index, "
+        "start_lat, start_lon, end_lat, end_lon) VALUES (:min_lat, :max_lat, "
+        ":min_lon, :max_lon, :shape_id, :segment_index, :start_lat, :start_lon, "
+        ":end_lat, :end_lon)"
+    )
+    segment_rows = get_shape_segment_rows(session)
+    for batch in chunked(segment_rows, SHAPE_SEGMENT_BATCH_SIZE):
+        session.execute(insert_segment, batch)
+
+
+def get_search_box(lat: float, lon: float, radius: float) -> Dict[str, float]:
+    lat_radius = radius / METERS_PER_DEGREE
+    lon_radius = radius / (METERS_PER_DEGREE * cos(radians(lat)))
+    return {
+        "min_lat": lat - lat_radius,
+        "max_lat": lat + lat_radius,
+        "min_lon": lon - lon_radius,
+        "max_lon": lon + lon_radius,
+    }
+
+
+def project_to_meters(
+    lat: float,
+    lon: float,
+    origin_lat: float,
+    origin_lon: float,
+) -> Tuple[float, float]:
+    # An equirectangular projection centered on the origin, which is accurate to
+    # well under a meter over the distances these searches cover
+    return (
+        (lon - origin_lon) * METERS_PER_DEGREE * cos(radians(origin_lat)),
+        (lat - origin_lat) * METERS_PER_DEGREE,
+    )
+
+
+def get_distance(lat: float, lon: float, other_lat: float, other_lon: float) -> float:
+    x, y = project_to_meters(other_lat, other_lon, lat, lon)
+    return (x * x + y * y) ** 0.5
+
+
+def get_stops_within_radius(
+    session: Session,
+    lat: float,
+    lon: float,
+    radius: float,
+) -> List[Tuple[Stop, float]]:
+    # Returns each stop within radius meters with its distance, nearest first
+    stop_ids = text(
+        f"SELECT id FROM {STOP_INDEX_TABLE} WHERE max_lat >= :min_lat "
+        "AND min_lat <= :max_lat AND max_lon >= :min_lon AND min_lon <= :max_lon"
+    ).columns(id=Integer)
+    stops = session.query(Stop).filter(Stop.id.in_(stop_ids))
+    stops_with_distances = [
+        (stop, get_distance(lat, lon, stop.stop_lat, stop.stop_lon))
+        for stop in stops.params(get_search_box(lat, lon, radius))
+    ]
+    return sorted(
+        (
+            (stop, distance)
+            for stop, distance in stops_with_distances
+            if distance <= radius
+        ),
+        key=lambda stop_with_distance: stop_with_distance[1],
+    )
+
+
+def get_nearest_stops(
+    session: Session,
+    lat: float,
+    lon: float,
+    count: int = 1,
+    max_radius: float = MAX_SEARCH_RADIUS,
+) -> List[Tuple[Stop, float]]:
+    # Every stop within a radius is found exactly, so once there are enough of
+    # them, no stop further out can be nearer
+    radius = INITIAL_SEARCH_RADIUS
+    while True:
+        radius = min(radius, max_radius)
+        stops = get_stops_within_radius(session, lat, lon, radius)
+        if len(stops) >= count or radius >= max_radius:
+            return stops[:count]
+        radius *= 2
+
+
+def snap_to_segment(
+    lat: float,
+    lon: float,
+    segment: Tuple[float, float, float, float],
+) -> Tuple[float, float, float]:
+    # Returns the nearest point on a segment to lat/lon, and its distance
+    start_x, start_y = project_to_meters(segment[0], segment[1], lat, lon)
+    end_x, end_y = project_to_meters(segment[2], segment[3], lat, lon)
+    dx, dy = end_x - start_x, end_y - start_y
+    t = 0.0
+    if dx or dy:
+        t = min(1.0, max(0.0, -(start_x * dx + start_y * dy) / (dx * dx + dy * dy)))
+    x, y = start_x + t * dx, start_y + t * dy
+    return (
+        segment[0] + t * (segment[2] - segment[0]),
+        segment[1] + t * (segment[3] - segment[1]),
+        (x * x + y * y) ** 0.5,
+    )
+
+
+def snap_to_shape(
+    session: Session,
+    lat: float,
+    lon: float,
+    shape_id: Union[None, str] = None,
+    max_radius: float = MAX_SEARCH_RADIUS,
+) -> Union[None, ShapeSnap]:
+    # Finds the nearest point on any shape (or on shape_id) to lat/lon
+    query = (
+        "SELECT shape_id, segment_index, start_lat, start_lon, end_lat, end_lon "
+        f"FROM {SHAPE_SEGMENT_INDEX_TABLE} WHERE max_lat >= :min_lat "
+        "AND min_lat <= :max_lat AND max_lon >= :min_lon AND min_lon <= :max_lon"
+    )
+    if shape_id is not None:
+        query += " AND shape_id = :shape_id"
+    radius = INITIAL_SEARCH_RADIUS
+    while True:
+        radius = min(radius, max_radius)
+        segments = session.execute(
+            text(query),
+            {**get_search_box(lat, lon, radius), "shape_id": shape_id},
+        )
+        nearest = None
+        for segment_shape_id, segment_index, *segment in segments:
+            snapped_lat, snapped_lon, distance = snap_to_segment(lat, lon, segment)
+            if distance <= radius and (nearest is None or distance < nearest.distance):
+                nearest = ShapeSnap(
+                    shape_id=segment_shape_id,
+                    segment_index=segment_index,
+                    lat=snapped_lat,
+                    lon=snapped_lon,
+                    distance=distance,
+                )
+        if nearest or radius >= max_radius:
+            return nearest
+        radius *= 2
@@ -0,0 +1,192 @@
+from concurrent.futures import (
+    Future,
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from dataclasses import dataclass
+from os import path
+from typing import TYPE_CHECKING, Callable, Dict, List, Literal, Tuple, Union
+
+from .build import GtfsFeedDownloadResult, build_feed_databases, download_feed_zip
+from .feed import GtfsFeed
+
+if TYPE_CHECKING:
+    from .ingest import IngestEngine
+
+FeedSyncStatus = Literal["built", "skipped", "failed"]
+
+
+@dataclass
+class FeedSyncResult(object):
+    feed: GtfsFeed
+    status: FeedSyncStatus
+    error: Union[None, BaseException] = None
+
+
+FeedSyncProgressCallback = Callable[[FeedSyncResult], None]
+
+
+def get_built_zip_checksum(db_path: str) -> Union[None, str]:
+    from .compression import is_compressed_path, read_compressed_db_zip_checksum
+    from .models.feed_info import FeedInfo
+    from .session import create_sqlalchemy_session
+
+    if not path.exists(db_path):
+        return None
+    if is_compressed_path(db_path):
+        # Dbs that were compressed before their checksums were stored alongside
+        # them have to be decompressed to be checked
+        checksum = read_compressed_db_zip_checksum(db_path)
+        if checksum:
+            return checksum
+    # Opened read-only so that checking a db never changes it
+    session = create_sqlalchemy_session(db_path, read_only=True)
+    try:
+        feed_info = session.query(FeedInfo).order_by(FeedInfo.id.desc()).first()
+        return feed_info.zip_md5_checksum if feed_info else None
+    finally:
+        session.close()
+        session.get_bind().dispose()
+
+
+def get_built_file_zip_checksum(file_path: str) -> Union[None, str]:
+    if file_path.endswith(".arrow"):
+        from .columnar import get_columnar_zip_checksum
+
+        return get_columnar_zip_checksum(file_path)
+    return get_built_zip_checksum(file_path)
+
+
+def get_built_feed_file_digests(db_path: str) -> Dict[str, str]:
+    from .digests import get_stored_feed_file_digests
+    from .session import create_sqlalchemy_session
+
+    session = create_sqlalchemy_session(db_path, read_only=True)
+    try:
+        return get_stored_feed_file_digests(session)
+    finally:
+        session.close()
+        session.get_bind().dispose()
+
+
+def has_same_feed_files(feed: GtfsFeed) -> bool:
+    # Compares the digests of the files in the feed's zip with those that its
+    # db was built from, which match even if the zip itself was repackaged
+    from .digests import get_feed_file_digests
+    from .reader import create_gtfs_reader
+
+    zip_path = path.join(feed.local_subdirectory, "data.zip")
+    db_path = feed.get_local_file_path(feed.required_feed_files()[0])
+    if not path.exists(zip_path):
+        return False
+    # The digests are only stored in the db, so every other file (like the
+    # columnar files) has to have been built from the same zip as it
+    built_checksums = set(
+        get_built_file_zip_checksum(feed.get_local_file_path(file))
+        for file in feed.required_feed_files()
+    )
+    if len(built_checksums) != 1 or None in built_checksums:
+        return False
+    built_digests = get_built_feed_file_digests(db_path)
+    return bool(built_digests) and built_digests == get_feed_file_digests(
+        create_gtfs_reader(zip_path)
+    )
+
+
+def is_feed_built_from(feed: GtfsFeed, result: GtfsFeedDownloadResult) -> bool:
+    if not feed.exists_locally():
+        return False
+    if all(
+        get_built_file_zip_checksum(feed.get_local_file_path(file))
+        == result.zip_md5_checksum
+        for file in feed.required_feed_files()
+    ):
+        return True
+    return has_same_feed_files(feed)
+
+
+def download_feed_zip_if_changed(
+    feed: GtfsFeed,
+    force_download: bool = False,
+) -> Tuple[GtfsFeedDownloadResult, bool]:
+    # Also returns whether the feed was already built from the zip. That check
+    # can hash every file in the zip, so it runs in the download worker too.
+    zip_path = path.join(feed.local_subdirectory, "data.zip")
+    download = download_feed_zip(feed.url, zip_path, force=force_download)
+    return download, is_feed_built_from(feed, download)
+
+
+def sync_feeds(
+    feeds: List[GtfsFeed],
+    download_workers: int = 4,
+    build_workers: Union[None, int] = None,
+    on_progress: Union[None, FeedSyncProgressCallback] = None,
+    ingest_batch_size: Union[None, int] = None,
+    ingest_engine: "IngestEngine" = "sqlalchemy",
+    bulk_build: bool = False,
+    rebuild_db: bool = True,
+    rebuild_compact_db: bool = True,
+    force_download: bool = False,
+) -> List[FeedSyncResult]:
+    # Downloads are I/O bound and run in threads, while builds are CPU bound and
+    # run in processes. A feed that fails doesn't stop the others.
+    results: List[FeedSyncResult] = []
+    pending_downloads: Dict[Future, GtfsFeed] = {}
+    pending_builds: Dict[Future, GtfsFeed] = {}
+
+    def report(feed: GtfsFeed, status: FeedSyncStatus, error=None):
+        result = FeedSyncResult(feed=feed, status=status, error=error)
+        results.append(result)
+        if on_progress:
+            on_progress(result)
+
+    with ThreadPoolExecutor(max_workers=download_workers) as download_executor:
+        with ProcessPoolExecutor(max_workers=build_workers) as build_executor:
+            for feed in feeds:
+                feed.ensure_subdirectory()
+                future = download_executor.submit(
+                    download_feed_zip_if_changed, feed, force_download
+                )
+                pending_downloads[future] = feed
+            while pending_downloads or pending_builds:
+                done, _ = wait(
+                    [*pending_downloads.keys(), *pending_builds.keys()],
+                    return_when=FIRST_COMPLETED,
+                )
+                for future in done:
+                    if future in pending_downloads:
+                        feed = pending_downloads.pop(future)
+                        try:
+                            download, is_built = future.result()
+                            if is_built:
+                                report(feed, "skipped")
+                                continue
+                        except Exception as ex:
+                            report(feed, "failed", ex)
+                            continue
+                        build_future = build_executor.submit(
+                            build_feed_databases,
+                            feed.local_subdirectory,
+                            download,
+                            compact_only=feed.compact_only,
+                            rebuild_db=rebuild_db,
+                            rebuild_compact_db=rebuild_compact_db,
+                            ingest_batch_size=ingest_batch_size,
+                            ingest_engine=ingest_engine,
+                            bulk_build=bulk_build,
+                            columnar=feed.columnar,
+                            interned_ids=feed.interned_ids,
+                            entity_digests=feed.entity_digests,
+                            compaction_profile=feed.compaction_profile,
+                        )
+                        pending_builds[build_future] = feed
+                    else:
+                        feed = pending_builds.pop(future)
+                        try:
+                            future.result()
+                            report(feed, "built")
+                        except Exception as ex:
+                            report(feed, "failed", ex)
+    return results
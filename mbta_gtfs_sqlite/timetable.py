@@ -0,0 +1,231 @@
+from dataclasses import dataclass
+from functools import cached_property
+from os import path
+from typing import Dict, Iterable, Tuple, Union
+
+try:
+    import numpy as np
+except ImportError as ex:
+    raise ImportError(
+        "Timetables require numpy (pip install mbta-gtfs-sqlite[timetable])"
+    ) from ex
+
+from .utils.files import atomic_write_path
+from .utils.sqlite import connect_read_only, get_db_zip_checksum
+
+TIMETABLE_ARRAYS = (
+    "trip_ids",
+    "stop_ids",
+    "trip_offsets",
+    "stop_indices",
+    "arrival_times",
+    "departure_times",
+    "stop_sequences",
+)
+TIMETABLE_BATCH_SIZE = 10000
+
+
+@dataclass
+class Timetable(object):
+    # Every trip_id and stop_id is stored once, and stop times refer to them by
+    # their index in these arrays
+    trip_ids: np.ndarray
+    stop_ids: np.ndarray
+    # Stop times are sorted by trip and stop_sequence, so the stop times of the
+    # trip at index i are the rows in trip_offsets[i]:trip_offsets[i + 1]
+    trip_offsets: np.ndarray
+    stop_indices: np.ndarray
+    arrival_times: np.ndarray
+    departure_times: np.ndarray
+    stop_sequences: np.ndarray
+    zip_md5_checksum: Union[None, str] = None
+
+    def __len__(self):
+        return len(self.stop_indices)
+
+    @cached_property
+    def _trip_indices_by_id(self) -> Dict[str, int]:
+        return {trip_id: index for index, trip_id in enumerate(self.trip_ids.tolist())}
+
+    @cached_property
+    def _stop_indices_by_id(self) -> Dict[str, int]:
+        return {stop_id: index for index, stop_id in enumerate(self.stop_ids.tolist())}
+
+    @cached_property
+    def trip_indices(self) -> np.ndarray:
+        # The index of the trip that each stop time belongs to
+        return np.repeat(
+            np.arange(len(self.trip_ids), dtype=np.int32),
+            np.diff(self.trip_offsets),
+        )
+
+    def get_trip_index(self, trip_id: str) -> Union[None, int]:
+        return self._trip_indices_by_id.get(trip_id)
+
+    def get_stop_index(self, stop_id: str) -> Union[None, int]:
+        return self._stop_indices_by_id.get(stop_id)
+
+    def get_trip_rows(self, trip_id: str) -> slice:
+        index = self._trip_indices_by_id[trip_id]
+        return slice(self.trip_offsets[index], self.trip_offsets[index + 1])
+
+    def _get_trip_mask(self, trip_ids: Iterable[str]) -> np.ndarray:
+        selected = np.zeros(len(self.trip_ids), dtype=bool)
+        indices = [self.get_trip_index(trip_id) for trip_id in trip_ids]
+        selected[[index for index in indices if index is not None]] = True
+        return selected[self.trip_indices]
+
+    def departures_from_stop(
+        self,
+        stop_id: str,
+        start_time: Union[None, int] = None,
+        end_time: Union[None, int] = None,
+        trip_ids: Union[None, Iterable[str]] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        # Returns the trip_ids and departure times (in seconds) of every trip
+        # leaving stop_id in [start_time, end_time), ordered by departure time
+        stop_index = self.get_stop_index(stop_id)
+        if stop_index is None:
+            return self.trip_ids[:0], self.departure_times[:0]
+        mask = self.stop_indices == stop_index
+        if start_time is not None:
+            mask &= self.departure_times >= start_time
+        if end_time is not None:
+            mask &= self.departure_times < end_time
+        if trip_ids is not None:
+            mask &= self._get_trip_mask(trip_ids)
+        rows = np.flatnonzero(mask)
+        rows = rows[np.argsort(self.departure_times[rows], kind="stable")]
+        return self.trip_ids[self.trip_indices[rows]], self.departure_times[rows]
+
+    def _get_first_rows_at_stop(self, stop_index: int) -> Tuple[np.ndarray, np.ndarray]:
+        rows = np.flatnonzero(self.stop_indices == stop_index)
+        trips, first = np.unique(self.trip_indices[rows], return_index=True)
+        return trips, rows[first]
+
+    def travel_times(
+        self,
+        from_stop_id: str,
+        to_stop_id: str,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        # Returns the trip_ids of every trip that stops at from_stop_id and later
+        # at to_stop_id, with the seconds between leaving one and reaching the
+        # other. A trip that visits a stop twice is measured from its first visit.
+        from_index = self.get_stop_index(from_stop_id)
+        to_index = self.get_stop_index(to_stop_id)
+        if from_index is None or to_index is None:
+            return self.trip_ids[:0], self.arrival_times[:0]
+        from_trips, from_rows = self._get_first_rows_at_stop(from_index)
+        to_trips, to_rows = self._get_first_rows_at_stop(to_index)
+        trips, from_positions, to_positions = np.intersect1d(
+            from_trips, to_trips, assume_unique=True, return_indices=True
+        )
+        from_rows = from_rows[from_positions]
+        to_rows = to_rows[to_positions]
+        forward = to_rows > from_rows
+        return (
+            self.trip_ids[trips[forward]],
+            self.arrival_times[to_rows[forward]]
+            - self.departure_times[from_rows[forward]],
+        )
+
+
+def read_timetable_from_db(db_path: str) -> Timetable:
+    # Rows are read in batches straight into preallocated arrays, with ids
+    # mapped to indices as they arrive, so only one batch of them is ever held
+    # as Python objects
+    connection = connect_read_only(db_path)
+    try:
+        zip_md5_checksum = get_db_zip_checksum(connection)
+        (row_count,) = connection.execute('SELECT COUNT(*) FROM "StopTime"').fetchone()
+        stop_indices = np.empty(row_count, dtype=np.int32)
+        arrival_times = np.empty(row_count, dtype=np.int32)
+        departure_times = np.empty(row_count, dtype=np.int32)
+        # GTFS allows any non-negative stop_sequence, so these may not fit in 16 bits
+        stop_sequences = np.empty(row_count, dtype=np.int32)
+        trip_ids = []
+        trip_offsets = []
+        stop_indices_by_id: Dict[str, int] = {}
+        cursor = connection.execute(
+            "SELECT trip_id, stop_id, arrival_time, departure_time, stop_sequence "
+            'FROM "StopTime" ORDER BY trip_id, stop_sequence'
+        )
+        position = 0
+        for batch in iter(lambda: cursor.fetchmany(TIMETABLE_BATCH_SIZE), []):
+            trip_column, stop_column, arrivals, departures, sequences = zip(*batch)
+            end = position + len(batch)
+            # Rows are grouped by trip, so each trip starts wherever the trip_id
+            # changes
+            for offset, trip_id in enumerate(trip_column):
+                if not trip_ids or trip_id != trip_ids[-1]:
+                    trip_ids.append(trip_id)
+                    trip_offsets.append(position + offset)
+            stop_indices[position:end] = [
+                stop_indices_by_id.setdefault(stop_id, len(stop_indices_by_id))
+                for stop_id in stop_column
+            ]
+            arrival_times[position:end] = arrivals
+            departure_times[position:end] = departures
+            stop_sequences[position:end] = sequences
+            position = end
+    finally:
+        connection.close()
+    # Stop ids are numbered in the order they're first seen, and renumbered here
+    # in sorted order
+    stop_ids = np.array(list(stop_indices_by_id.keys()), dtype=str)
+    stop_order = np.argsort(stop_ids, kind="stable")
+    sorted_positions = np.empty(len(stop_ids), dtype=np.int32)
+    sorted_positions[stop_order] = np.arange(len(stop_ids), dtype=np.int32)
+    trip_offsets.append(row_count)
+    return Timetable(
+        trip_ids=np.array(trip_ids, dtype=str),
+        stop_ids=stop_ids[stop_order],
+        trip_offsets=np.array(trip_offsets, dtype=np.int64),
+        stop_indices=sorted_positions[stop_indices],
+        arrival_times=arrival_times,
+        departure_times=departure_times,
+        stop_sequences=stop_sequences,
+        zip_md5_checksum=zip_md5_checksum,
+    )
+
+
+def save_timetable(timetable: Timetable, file_path: str):
+    # Saved uncompressed, so that loading it is little more than a read
+    arrays = {name: getattr(timetable, name) for name in TIMETABLE_ARRAYS}
+    # np.savez adds .npz to any path that doesn't already end with it
+    with atomic_write_path(file_path, ".tmp.npz") as temp_path:
+        np.savez(
+            temp_path,
+            zip_md5_checksum=np.array(timetable.zip_md5_checksum or ""),
+            **arrays,
+        )
+
+
+def read_timetable_from_file(file_path: str) -> Timetable:
+    with np.load(file_path, allow_pickle=False) as data:
+        return Timetable(
+            zip_md5_checksum=str(data["zip_md5_checksum"]) or None,
+            **{name: data[name] for name in TIMETABLE_ARRAYS},
+        )
+
+
+def load_timetable(
+    db_path: str,
+    cache_path: Union[None, str] = None,
+) -> Timetable:
+    # A cached timetable is used as long as it was built from the same zip as
+    # the db (or the db is gone, as it is for compact-only feeds)
+    if cache_path and path.exists(cache_path):
+        timetable = read_timetable_from_file(cache_path)
+        if not path.exists(db_path):
+            return timetable
+        connection = connect_read_only(db_path)
+        try:
+            if get_db_zip_checksum(connection) == timetable.zip_md5_checksum:
+                return timetable
+        finally:
+            connection.close()
+    timetable = read_timetable_from_db(db_path)
+    if cache_path:
+        save_timetable(timetable, cache_path)
+    return timetable
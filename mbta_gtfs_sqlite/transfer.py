@@ -0,0 +1,215 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from os import path, remove
+from typing import TYPE_CHECKING, Any, Callable, Iterable, List, Set, Tuple
+
+from .compression import (
+    COMPRESSED_SUFFIX,
+    compress_file,
+    decompress_file,
+    decompress_stream,
+    is_compressed_path,
+)
+from .feed import ALL_DB_FILES
+from .utils.files import atomic_write_path
+
+if TYPE_CHECKING:
+    from .feed import GtfsFeed
+
+# Files are transferred concurrently, across feeds, and each large file is also
+# split into parts that are transferred concurrently
+DEFAULT_TRANSFER_WORKERS = 8
+MULTIPART_CHUNK_SIZE = 16 * 1024 * 1024
+MULTIPART_CONCURRENCY = 4
+
+# Uploads store the sha256 of each file in its object's metadata, so that
+# downloads can be verified without a separate manifest
+SHA256_METADATA_KEY = "sha256"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class FeedFileTransfer(object):
+    feed: "GtfsFeed"
+    file: str
+
+    @property
+    def compressed(self):
+        return self.feed.compressed and self.file in ALL_DB_FILES
+
+    @property
+    def key(self):
+        suffix = COMPRESSED_SUFFIX if self.compressed else ""
+        return f"{self.feed.key}/{self.file}{suffix}"
+
+    @property
+    def local_path(self):
+        return path.join(self.feed.local_subdirectory, self.file)
+
+
+def create_transfer_config(
+    chunk_size: int = MULTIPART_CHUNK_SIZE,
+    concurrency: int = MULTIPART_CONCURRENCY,
+):
+    from boto3.s3.transfer import TransferConfig
+
+    return TransferConfig(
+        multipart_threshold=chunk_size,
+        multipart_chunksize=chunk_size,
+        max_concurrency=concurrency,
+    )
+
+
+def get_file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class HashingReader(object):
+    # Hashes a stream as it's read
+    def __init__(self, stream):
+        self.stream = stream
+        self.digest = hashlib.sha256()
+
+    def read(self, size: int = -1):
+        chunk = self.stream.read(size if size >= 0 else None)
+        self.digest.update(chunk)
+        return chunk
+
+    def hexdigest(self):
+        return self.digest.hexdigest()
+
+
+def list_remote_keys(bucket, prefix: str) -> Set[str]:
+    # Bucket resources aren't thread-safe, but their clients are, so transfers
+    # always go through the client
+    paginator = bucket.meta.client.get_paginator("list_objects_v2")
+    keys = set()
+    for page in paginator.paginate(Bucket=bucket.name, Prefix=prefix):
+        keys.update(obj["Key"] for obj in page.get("Contents", []))
+    return keys
+
+
+def feed_exists_remotely(feed: "GtfsFeed") -> bool:
+    try:
+        bucket = feed.archive.s3_bucket
+    except RuntimeError:
+        return False
+    remote_keys = list_remote_keys(bucket, f"{feed.key}/")
+    return all(
+        FeedFileTransfer(feed, file).key in remote_keys
+        for file in feed.required_feed_files()
+    )
+
+
+def download_feed_file(transfer: FeedFileTransfer, config):
+    bucket = transfer.feed.archive.s3_bucket
+    client = bucket.meta.client
+    # The file is only moved into place once it's complete and verified
+    with atomic_write_path(transfer.local_path, ".download") as temp_path:
+        if transfer.compressed:
+            # Compressed objects are decompressed as they stream in, so only the
+            # uncompressed db is ever written to disk. Their checksum is that of
+            # the compressed bytes.
+            response = client.get_object(Bucket=bucket.name, Key=transfer.key)
+            expected_sha256 = response.get("Metadata", {}).get(SHA256_METADATA_KEY)
+            body = HashingReader(response["Body"])
+            with open(temp_path, "wb") as target:
+                decompress_stream(body, target)
+            sha256 = body.hexdigest()
+        else:
+            head = client.head_object(Bucket=bucket.name, Key=transfer.key)
+            expected_sha256 = head.get("Metadata", {}).get(SHA256_METADATA_KEY)
+            client.download_file(bucket.name, transfer.key, temp_path, Config=config)
+            sha256 = get_file_sha256(temp_path) if expected_sha256 else None
+        # Objects uploaded before checksums were stored can't be verified
+        if expected_sha256 and sha256 != expected_sha256:
+            raise RuntimeError(f"Checksum mismatch for {transfer.key}")
+
+
+def get_upload_path(transfer: FeedFileTransfer) -> Tuple[str, bool]:
+    # The path of a local file with the contents of the object, and whether it's
+    # a temporary file that was (de)compressed for the upload
+    local_path = transfer.feed.get_local_file_path(transfer.file)
+    if is_compressed_path(local_path) == transfer.compressed:
+        return local_path, False
+    temp_path = f"{transfer.local_path}.upload"
+    if transfer.compressed:
+        compress_file(local_path, temp_path)
+    else:
+        decompress_file(local_path, temp_path)
+    return temp_path, True
+
+
+def upload_feed_file(transfer: FeedFileTransfer, config):
+    bucket = transfer.feed.archive.s3_bucket
+    upload_path, is_temp = get_upload_path(transfer)
+    try:
+        bucket.meta.client.upload_file(
+            upload_path,
+            bucket.name,
+            transfer.key,
+            ExtraArgs={"Metadata": {SHA256_METADATA_KEY: get_file_sha256(upload_path)}},
+            Config=config,
+        )
+    finally:
+        if is_temp:
+            remove(upload_path)
+
+
+def run_in_threads(
+    task: Callable[[Any], Any],
+    items: Iterable[Any],
+    max_workers: int,
+) -> List[Any]:
+    # Waits for every task, even if some fail, then raises the first failure
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(task, item) for item in items]
+    errors = [future.exception() for future in futures if future.exception()]
+    if errors:
+        raise errors[0]
+    return [future.result() for future in futures]
+
+
+def download_feeds(
+    feeds: List["GtfsFeed"],
+    max_workers: int = DEFAULT_TRANSFER_WORKERS,
+    config=None,
+):
+    config = config or create_transfer_config()
+    exist_remotely = run_in_threads(feed_exists_remotely, feeds, max_workers)
+    for feed, exists_remotely in zip(feeds, exist_remotely):
+        if not exists_remotely:
+            raise RuntimeError(f"Feed {feed.key} does not exist remotely")
+    transfers = []
+    for feed in feeds:
+        feed.ensure_subdirectory()
+        transfers.extend(
+            FeedFileTransfer(feed, file) for file in feed.required_feed_files()
+        )
+    run_in_threads(
+        lambda transfer: download_feed_file(transfer, config), transfers, max_workers
+    )
+
+
+def upload_feeds(
+    feeds: List["GtfsFeed"],
+    max_workers: int = DEFAULT_TRANSFER_WORKERS,
+    config=None,
+):
+    config = config or create_transfer_config()
+    for feed in feeds:
+        if not feed.exists_locally():
+            raise RuntimeError(f"Feed {feed.key} does not exist locally")
+    transfers = [
+        FeedFileTransfer(feed, file)
+        for feed in feeds
+        for file in feed.required_feed_files()
+    ]
+    run_in_threads(
+        lambda transfer: upload_feed_file(transfer, config), transfers, max_workers
+    )
@@ -0,0 +1,16 @@
+from contextlib import contextmanager
+from os import path, remove, replace
+
+
+@contextmanager
+def atomic_write_path(file_path: str, temp_suffix: str = ".tmp"):
+    # Yields a temporary path to write to, which only replaces file_path once
+    # the block completes, and is removed if it fails
+    temp_path = file_path + temp_suffix
+    try:
+        yield temp_path
+        replace(temp_path, file_path)
+    except BaseException as ex:
+        if path.exists(temp_path):
+            remove(temp_path)
+        raise ex
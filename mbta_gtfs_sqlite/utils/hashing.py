@@ -0,0 +1,12 @@
+import hashlib
+from typing import Any
+
+CONTENT_HASH_SIZE = 16
+
+
+def get_content_hash(*values: Any) -> bytes:
+    # A hash of some values (like the columns of a row) that only depends on the
+    # values themselves, so it can be compared across dbs
+    return hashlib.blake2b(
+        repr(values).encode("utf-8"), digest_size=CONTENT_HASH_SIZE
+    ).digest()
@@ -0,0 +1,84 @@
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+from heapq import heappop, heappush
+from typing import Callable, Dict, Generic, Iterable, List, TypeVar, Union
+
+T = TypeVar("T")
+
+
+class DateIntervalIndex(Generic[T]):
+    # Indexes items that are each valid over an inclusive range of dates. When
+    # ranges overlap, a date belongs to the covering item that starts latest.
+    def __init__(
+        self,
+        items: Iterable[T],
+        get_start_date: Callable[[T], date],
+        get_end_date: Callable[[T], date],
+    ):
+        self._get_end_date = get_end_date
+        self._items = sorted(items, key=get_start_date)
+        self._start_dates = [get_start_date(item) for item in self._items]
+        # A running maximum of end dates, so that a bisect can skip every item
+        # that ends before a given date
+        self._max_end_dates = []
+        for item in self._items:
+            end_date = get_end_date(item)
+            if self._max_end_dates and self._max_end_dates[-1] > end_date:
+                end_date = self._max_end_dates[-1]
+            self._max_end_dates.append(end_date)
+        self._build_segments()
+
+    def _build_segments(self):
+        # Splits the timeline into disjoint segments, each owned by one item (or
+        # no item), by sweeping over the dates where items start and stop
+        boundaries = sorted(
+            set(self._start_dates).union(
+                self._get_end_date(item) + timedelta(days=1) for item in self._items
+            )
+        )
+        self._segment_start_dates: List[date] = []
+        self._segment_items: List[Union[None, T]] = []
+        active = []
+        next_item_index = 0
+        for boundary in boundaries:
+            while (
+                next_item_index < len(self._items)
+                and self._start_dates[next_item_index] <= boundary
+            ):
+                heappush(active, (-next_item_index, next_item_index))
+                next_item_index += 1
+            while active and self._get_end_date(self._items[active[0][1]]) < boundary:
+                heappop(active)
+            owner = self._items[active[0][1]] if active else None
+            if self._segment_items and self._segment_items[-1] is owner:
+                continue
+            self._segment_start_dates.append(boundary)
+            self._segment_items.append(owner)
+
+    def at(self, target_date: date) -> Union[None, T]:
+        index = bisect_right(self._segment_start_dates, target_date) - 1
+        if index < 0:
+            return None
+        return self._segment_items[index]
+
+    def at_many(self, target_dates: Iterable[date]) -> Dict[date, Union[None, T]]:
+        return {target_date: self.at(target_date) for target_date in target_dates}
+
+    def overlapping(
+        self,
+        start_date: Union[None, date] = None,
+        end_date: Union[None, date] = None,
+    ) -> List[T]:
+        lower = (
+            0 if start_date is None else bisect_left(self._max_end_dates, start_date)
+        )
+        upper = (
+            len(self._items)
+            if end_date is None
+            else bisect_right(self._start_dates, end_date)
+        )
+        return [
+            item
+            for item in self._items[lower:upper]
+            if start_date is None or self._get_end_date(item) >= start_date
+        ]
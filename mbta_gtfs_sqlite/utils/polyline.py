@@ -0,0 +1,115 @@
+from math import cos, radians
+from typing import TYPE_CHECKING, List, Sequence, Tuple
+
+if TYPE_CHECKING:
+    import numpy
+
+LatLon = Tuple[float, float]
+
+# Six decimal places (about 10cm) is as precise as the MBTA's shapes.txt
+POLYLINE_PRECISION = 6
+METERS_PER_DEGREE = 111_320
+
+
+def encode_polyline(points: Sequence[LatLon], precision: int = POLYLINE_PRECISION):
+    # Uses the encoded polyline algorithm format, where each coordinate is stored
+    # as a variable-length delta from the previous one
+    factor = 10**precision
+    chunks = []
+    previous_lat, previous_lon = 0, 0
+    for lat, lon in points:
+        lat, lon = round(lat * factor), round(lon * factor)
+        for delta in (lat - previous_lat, lon - previous_lon):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                chunks.append(chr((0x20 | (value & 0x1F)) + 63))
+                value >>= 5
+            chunks.append(chr(value + 63))
+        previous_lat, previous_lon = lat, lon
+    return "".join(chunks)
+
+
+def decode_polyline_deltas(encoded: str) -> List[int]:
+    deltas = []
+    value, shift = 0, 0
+    for char in encoded:
+        byte = ord(char) - 63
+        value |= (byte & 0x1F) << shift
+        shift += 5
+        if byte < 0x20:
+            deltas.append(~(value >> 1) if value & 1 else value >> 1)
+            value, shift = 0, 0
+    return deltas
+
+
+def decode_polyline(
+    encoded: str,
+    precision: int = POLYLINE_PRECISION,
+) -> List[LatLon]:
+    factor = 10**precision
+    deltas = decode_polyline_deltas(encoded)
+    points = []
+    lat, lon = 0, 0
+    for index in range(0, len(deltas), 2):
+        lat += deltas[index]
+        lon += deltas[index + 1]
+        points.append((lat / factor, lon / factor))
+    return points
+
+
+def decode_polyline_to_array(
+    encoded: str,
+    precision: int = POLYLINE_PRECISION,
+) -> "numpy.ndarray":
+    # Returns an (n, 2) array of lat/lon pairs
+    import numpy as np
+
+    deltas = np.array(decode_polyline_deltas(encoded), dtype=np.int64)
+    return np.cumsum(deltas.reshape(-1, 2), axis=0) / 10**precision
+
+
+def get_squared_segment_distance(
+    point: Tuple[float, float],
+    start: Tuple[float, float],
+    end: Tuple[float, float],
+) -> float:
+    x, y = point
+    start_x, start_y = start
+    dx, dy = end[0] - start_x, end[1] - start_y
+    if dx or dy:
+        t = ((x - start_x) * dx + (y - start_y) * dy) / (dx * dx + dy * dy)
+        t = min(1, max(0, t))
+        start_x, start_y = start_x + t * dx, start_y + t * dy
+    return (x - start_x) ** 2 + (y - start_y) ** 2
+
+
+def simplify_polyline(points: Sequence[LatLon], tolerance: float) -> List[LatLon]:
+    # Douglas-Peucker simplification, keeping every point that is more than
+    # tolerance meters away from the simplified line
+    if len(points) < 3 or tolerance <= 0:
+        return list(points)
+    # Project onto a plane in meters, which is close enough over the extent of
+    # a single shape
+    lon_scale = cos(radians(points[0][0]))
+    projected = [
+        (lat * METERS_PER_DEGREE, lon * METERS_PER_DEGREE * lon_scale)
+        for lat, lon in points
+    ]
+    squared_tolerance = tolerance * tolerance
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    ranges = [(0, len(points) - 1)]
+    while ranges:
+        first, last = ranges.pop()
+        farthest_index, farthest_distance = None, squared_tolerance
+        for index in range(first + 1, last):
+            distance = get_squared_segment_distance(
+                projected[index], projected[first], projected[last]
+            )
+            if distance > farthest_distance:
+                farthest_index, farthest_distance = index, distance
+        if farthest_index is not None:
+            keep[farthest_index] = True
+            ranges.append((first, farthest_index))
+            ranges.append((farthest_index, last))
+    return [point for point, kept in zip(points, keep) if kept]
@@ -0,0 +1,21 @@
+import sqlite3
+from os import path
+from typing import Union
+from urllib.parse import quote
+
+
+def get_read_only_uri(file_path: str) -> str:
+    return f"file:{quote(path.abspath(file_path))}?mode=ro"
+
+
+def connect_read_only(file_path: str, **kwargs) -> sqlite3.Connection:
+    # Opens a db as-is: nothing is created, and sqlite refuses any writes
+    return sqlite3.connect(get_read_only_uri(file_path), uri=True, **kwargs)
+
+
+def get_db_zip_checksum(connection: sqlite3.Connection) -> Union[None, str]:
+    # The checksum of the zip that the db was (last) built from
+    row = connection.execute(
+        'SELECT zip_md5_checksum FROM "FeedInfo" ORDER BY id DESC LIMIT 1'
+    ).fetchone()
+    return row[0] if row else None
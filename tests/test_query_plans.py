@@ -0,0 +1,71 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine
+
+from mbta_gtfs_sqlite.compact import make_compact_db
+from mbta_gtfs_sqlite.intern import intern_feed_ids
+from mbta_gtfs_sqlite.models import Base
+from mbta_gtfs_sqlite.query_plans import (
+    HOT_QUERIES,
+    find_slow_query_plans,
+    is_slow_plan_step,
+)
+
+
+def create_full_db(file_path: str):
+    engine = create_engine(f"sqlite:///{file_path}")
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    file_path = str(tmp_path / "gtfs.sqlite3")
+    create_full_db(file_path)
+    return file_path
+
+
+@pytest.fixture(params=["full", "interned", "compact"])
+def any_db_path(request, tmp_path, db_path):
+    # Each kind of db is built the same way as in a real build, so their plans
+    # go through the same indexes (and, once interned, the same views)
+    if request.param == "interned":
+        intern_feed_ids(db_path)
+    elif request.param == "compact":
+        compact_db_path = str(tmp_path / "gtfs_compact.sqlite3")
+        make_compact_db(db_path, compact_db_path)
+        return compact_db_path
+    return db_path
+
+
+def test_hot_queries_use_indexes(any_db_path):
+    connection = sqlite3.connect(any_db_path)
+    try:
+        connection.execute("ANALYZE")
+        assert find_slow_query_plans(connection) == {}
+    finally:
+        connection.close()
+
+
+def test_full_index_scan_is_slow(db_path):
+    connection = sqlite3.connect(db_path)
+    try:
+        slow_plans = find_slow_query_plans(
+            connection,
+            {"late trips": 'SELECT trip_id FROM "StopTime" WHERE departure_time > :t'},
+        )
+    finally:
+        connection.close()
+    assert list(slow_plans) == ["late trips"]
+
+
+def test_plan_steps():
+    assert is_slow_plan_step("SCAN StopTime")
+    assert is_slow_plan_step(
+        "SCAN StopTime USING COVERING INDEX ix_StopTime_stop_id_departure_time"
+    )
+    assert is_slow_plan_step("USE TEMP B-TREE FOR ORDER BY")
+    assert not is_slow_plan_step("SEARCH Trip USING INDEX ix_Trip_trip_id (trip_id=?)")
+    assert not is_slow_plan_step("SCAN FeedInfo")
+    assert HOT_QUERIES
@@ -0,0 +1,151 @@
+import os
+from datetime import date
+
+import pytest
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+from mbta_gtfs_sqlite import MbtaGtfsArchive
+from mbta_gtfs_sqlite.feed import GtfsFeed
+from mbta_gtfs_sqlite.transfer import (
+    SHA256_METADATA_KEY,
+    create_transfer_config,
+    download_feeds,
+    upload_feeds,
+)
+
+BUCKET_NAME = "gtfs-test-bucket"
+
+
+@pytest.fixture
+def bucket():
+    with moto.mock_aws():
+        s3 = boto3.resource("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket=BUCKET_NAME)
+        yield s3.Bucket(BUCKET_NAME)
+
+
+@pytest.fixture
+def archive(tmp_path, bucket):
+    return MbtaGtfsArchive(local_archive_path=str(tmp_path), s3_bucket=bucket)
+
+
+def create_feed(archive: MbtaGtfsArchive, key: str = "20240101") -> GtfsFeed:
+    return GtfsFeed(archive, key, "", "", date(2024, 1, 1), date(2024, 3, 31))
+
+
+def write_feed_files(feed: GtfsFeed, size: int = 4096):
+    feed.ensure_subdirectory()
+    contents = {}
+    for file in feed.required_feed_files():
+        contents[file] = os.urandom(size // 2) * 2
+        with open(os.path.join(feed.local_subdirectory, file), "wb") as target:
+            target.write(contents[file])
+    return contents
+
+
+def read_feed_files(feed: GtfsFeed):
+    contents = {}
+    for file in feed.required_feed_files():
+        with open(feed.get_local_file_path(file), "rb") as source:
+            contents[file] = source.read()
+    return contents
+
+
+def test_round_trip(archive, bucket):
+    feed = create_feed(archive)
+    assert not feed.exists_remotely()
+    contents = write_feed_files(feed)
+    feed.upload_to_s3()
+    assert feed.exists_remotely()
+    for file in feed.required_feed_files():
+        metadata = bucket.Object(f"{feed.key}/{file}").metadata
+        assert SHA256_METADATA_KEY in metadata
+    feed.delete_locally()
+    feed.download_from_s3()
+    assert feed.exists_locally()
+    assert read_feed_files(feed) == contents
+    assert sorted(os.listdir(feed.local_subdirectory)) == sorted(contents)
+
+
+def test_multipart_round_trip_of_many_feeds(archive):
+    feeds = [create_feed(archive, key) for key in ("20240101", "20240401")]
+    config = create_transfer_config(chunk_size=5 * 1024 * 1024)
+    contents = [write_feed_files(feed, size=11 * 1024 * 1024) for feed in feeds]
+    upload_feeds(feeds, config=config)
+    for feed in feeds:
+        feed.delete_locally()
+    download_feeds(feeds, config=config)
+    assert [read_feed_files(feed) for feed in feeds] == contents
+
+
+def test_missing_feed(archive):
+    feed = create_feed(archive)
+    with pytest.raises(RuntimeError, match="does not exist remotely"):
+        feed.download_from_s3()
+    with pytest.raises(RuntimeError, match="does not exist locally"):
+        feed.upload_to_s3()
+
+
+def test_checksum_mismatch(archive, bucket):
+    feed = create_feed(archive)
+    write_feed_files(feed)
+    feed.upload_to_s3()
+    feed.delete_locally()
+    key = f"{feed.key}/{feed.required_feed_files()[0]}"
+    metadata = bucket.Object(key).metadata
+    bucket.put_object(Key=key, Body=b"corrupted", Metadata=metadata)
+    with pytest.raises(RuntimeError, match="Checksum mismatch"):
+        feed.download_from_s3()
+    # Nothing is left behind for the file that failed
+    assert os.listdir(feed.local_subdirectory) == [feed.required_feed_files()[1]]
+
+
+def test_compressed_round_trip(archive, bucket):
+    pytest.importorskip("zstandard")
+    feed = create_feed(archive)
+    feed.use_compression()
+    contents = write_feed_files(feed)
+    feed.upload_to_s3()
+    remote_keys = sorted(obj.key for obj in bucket.objects.all())
+    assert remote_keys == sorted(f"{feed.key}/{file}.zst" for file in contents)
+    assert feed.exists_remotely()
+    feed.delete_locally()
+    feed.download_from_s3()
+    assert read_feed_files(feed) == contents
+    assert sorted(os.listdir(feed.local_subdirectory)) == sorted(contents)
+
+
+def test_compressed_checksum_mismatch(archive, bucket):
+    pytest.importorskip("zstandard")
+    feed = create_feed(archive)
+    feed.use_compression()
+    write_feed_files(feed)
+    feed.upload_to_s3()
+    feed.delete_locally()
+    other_key = f"{feed.key}/{feed.required_feed_files()[1]}.zst"
+    key = f"{feed.key}/{feed.required_feed_files()[0]}.zst"
+    metadata = bucket.Object(key).metadata
+    # A valid zstd stream, but not the one that was uploaded
+    other_body = bucket.Object(other_key).get()["Body"].read()
+    bucket.put_object(Key=key, Body=other_body, Metadata=metadata)
+    with pytest.raises(RuntimeError, match="Checksum mismatch"):
+        feed.download_from_s3()
+    assert os.listdir(feed.local_subdirectory) == [feed.required_feed_files()[1]]
+
+
+def test_compressed_local_files_are_uploaded_as_is(archive, bucket):
+    pytest.importorskip("zstandard")
+    feed = create_feed(archive)
+    contents = write_feed_files(feed)
+    feed.compress_locally()
+    feed.upload_to_s3()
+    feed.use_compression()
+    feed.upload_to_s3()
+    feed.delete_locally()
+    for compressed in (True, False):
+        feed.use_compression(compressed)
+        feed.download_from_s3()
+        assert read_feed_files(feed) == contents
+        feed.delete_locally()